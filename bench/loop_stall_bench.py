@@ -0,0 +1,76 @@
+"""Measure event loop stalls during concurrent /start course_... lookups, blocking pymongo vs Motor.
+
+Usage: DATABASE_URI=mongodb://... python bench/loop_stall_bench.py [concurrent requests]   (default: 500)
+
+Needs a reachable MongoDB. It seeds and finally drops a scratch collection in
+a "<DATABASE_NAME>_bench" database, so bot data is never touched. While the
+lookups run, a heartbeat task sleeps 1 ms in a loop and records how late it
+wakes up; that lateness is time the loop could not serve any other update.
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+
+for name, value in (("API_ID", "1"), ("API_HASH", "bench"), ("BOT_TOKEN", "bench"), ("LOG_CHANNEL", "-100")):
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymongo import MongoClient
+from info import DATABASE_URI, DATABASE_NAME
+from database.db_helpers import get_mongo_client
+
+COURSES = 1000
+HEARTBEAT = 0.001
+COLLECTION = "courses"
+
+async def heartbeat(lateness, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT)
+        lateness.append(time.perf_counter() - start - HEARTBEAT)
+
+async def measure(label, lookup, requests):
+    lateness = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lateness, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(lookup(f"course_{i % COURSES}") for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    lateness.sort()
+    p99 = lateness[int(len(lateness) * 0.99) - 1] if len(lateness) > 1 else lateness[-1]
+    print(
+        f"{label:<16}{elapsed * 1000:>10.0f}{len(lateness):>12}"
+        f"{statistics.median(lateness) * 1000:>12.2f}{p99 * 1000:>10.2f}{lateness[-1] * 1000:>10.2f}"
+    )
+
+async def main(requests):
+    sync_client = MongoClient(DATABASE_URI)
+    sync_col = sync_client[DATABASE_NAME + "_bench"][COLLECTION]
+    motor_col = get_mongo_client(DATABASE_URI)[DATABASE_NAME + "_bench"][COLLECTION]
+
+    sync_col.drop()
+    sync_col.insert_many([{"course_id": f"course_{i}", "course_name": f"Bench Course {i}"} for i in range(COURSES)])
+    sync_col.create_index("course_id", unique=True)
+
+    # The data layer before the Motor move: an async def calling pymongo directly
+    async def blocking_lookup(course_id):
+        return sync_col.find_one({"course_id": course_id})
+
+    # Same shape as courses_db.get_course_by_id
+    async def motor_lookup(course_id):
+        return await motor_col.find_one({"course_id": course_id})
+
+    try:
+        print(f"{requests} concurrent lookups; heartbeat lateness in ms")
+        print(f"{'client':<16}{'total ms':>10}{'heartbeats':>12}{'median':>12}{'p99':>10}{'max':>10}")
+        await measure("pymongo (old)", blocking_lookup, requests)
+        await measure("motor", motor_lookup, requests)
+    finally:
+        sync_col.drop()
+        sync_client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
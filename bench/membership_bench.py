@@ -0,0 +1,48 @@
+"""Time premium/ban membership checks at 1M users: MembershipCache sets against the old lists.
+
+Usage: python bench/membership_bench.py [users]   (default: 1000000)
+"""
+import os
+import sys
+import time
+import random
+
+# info.py reads these at import time
+for name, value in (("API_ID", "1"), ("API_HASH", "bench"), ("BOT_TOKEN", "bench"), ("LOG_CHANNEL", "-100")):
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.membership import MembershipCache
+
+LOOKUPS = 100000
+LIST_LOOKUPS = 50
+
+def per_lookup_us(fn, ids):
+    start = time.perf_counter()
+    for user_id in ids:
+        fn(user_id)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+def main(users):
+    rng = random.Random(1)
+    # Telegram ids are sparse, so draw them from a wide range
+    premium = rng.sample(range(10**9, 8 * 10**9), users)
+    # Mostly non-premium users, as in real traffic
+    probes = [rng.choice(premium) if rng.random() < 0.1 else rng.randrange(10**9, 8 * 10**9) for _ in range(LOOKUPS)]
+
+    cache = MembershipCache()
+    start = time.perf_counter()
+    cache.load(premium_users=premium)
+    load = time.perf_counter() - start
+    premium_list = list(premium)
+
+    print(f"{users:,} premium users (set loaded in {load:.2f} s)")
+    print(f"list scan (old temp.PREMIUM_USERS): {per_lookup_us(premium_list.__contains__, probes[:LIST_LOOKUPS]):>12.2f} us")
+    print(f"set lookup:                         {per_lookup_us(cache.premium_users.__contains__, probes):>12.2f} us")
+    print(f"is_premium(), cold negative cache:  {per_lookup_us(cache.is_premium, probes):>12.2f} us")
+    for user_id in probes:
+        if cache.is_premium(user_id) is None:
+            cache.set_premium(user_id, False)
+    print(f"is_premium(), warm negative cache:  {per_lookup_us(cache.is_premium, probes):>12.2f} us")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
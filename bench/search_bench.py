@@ -0,0 +1,87 @@
+"""Compare CourseSearchIndex against the regex scan search_courses falls back to.
+
+Usage: python bench/search_bench.py [size ...]   (default: 10000 100000 1000000)
+
+The regex path is replayed in-process over a list of names with the same
+pattern _regex_search_courses builds (a count plus a first-page scan), so
+it is a lower bound on the MongoDB path: no round trips, no BSON decoding.
+"""
+import os
+import re
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.search_index import CourseSearchIndex
+
+WORDS = [
+    "sicilian", "najdorf", "dragon", "french", "winawer", "caro", "kann", "advance",
+    "london", "system", "queens", "gambit", "declined", "accepted", "kings", "indian",
+    "grunfeld", "nimzo", "catalan", "english", "ruy", "lopez", "berlin", "italian",
+    "scotch", "vienna", "endgame", "middlegame", "tactics", "strategy", "masterclass",
+    "beginner", "advanced", "repertoire", "white", "black", "attack", "defence",
+]
+QUERIES = ["endgame", "caro kann", "sicil", "gambit dec", "masterclass white attack", "najd"]
+PAGE_SIZE = 20
+REPEATS = 20
+
+def make_courses(count, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for i in range(count):
+        name = " ".join(rng.sample(WORDS, rng.randint(2, 5))).title() + f" Vol {i % 10 + 1}"
+        yield {
+            "course_id": f"c{i}",
+            "course_name": name,
+            "added_on": start + timedelta(minutes=i),
+            "download_count": rng.randint(0, 5000),
+        }
+
+def regex_pattern(query):
+    # Same pattern as courses_db._regex_search_courses
+    if ' ' not in query:
+        return r'(\b|[\.\+\-_])' + query + r'(\b|[\.\+\-_])'
+    return query.replace(' ', r'.*[\s\.\+\-_]')
+
+def regex_search(names, query):
+    regex = re.compile(regex_pattern(query), flags=re.IGNORECASE)
+    total = sum(1 for name in names if regex.search(name))
+    # Newest first, like sort('_id', -1)
+    page = []
+    for name in reversed(names):
+        if regex.search(name):
+            page.append(name)
+            if len(page) > PAGE_SIZE:
+                break
+    return total, page
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def run(size):
+    courses = list(make_courses(size))
+    names = [course["course_name"] for course in courses]
+    index = CourseSearchIndex()
+    start = time.perf_counter()
+    for course in courses:
+        index.add(course)
+    build = time.perf_counter() - start
+
+    print(f"\n{size:,} courses (index built in {build:.1f} s)")
+    print(f"{'query':<26}{'matches':>10}{'index ms':>11}{'regex ms':>11}")
+    regex_repeats = max(1, REPEATS * 10000 // size)
+    for query in QUERIES:
+        _, total, _ = index.search(query, PAGE_SIZE)
+        index_ms = timed(lambda: index.search(query, PAGE_SIZE), REPEATS)
+        regex_ms = timed(lambda: regex_search(names, query), regex_repeats)
+        print(f"{query:<26}{total:>10,}{index_ms:>11.3f}{regex_ms:>11.1f}")
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for size in sizes:
+        run(size)
@@ -19,9 +19,17 @@ logging.getLogger("pyrogram").setLevel(logging.ERROR)
 logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
 
 from pyrogram import Client, idle
+from pyrogram.session import Session
 from database.users_chats_db import db
+from database.courses_db import load_search_index, warm_course_cache
+from database.indexes import ensure_indexes
 from info import *
-from utils import temp
+from utils import temp, get_bot_me
+from database.membership import membership
+from ratelimit import send_scheduler, query_chat_id
+from delivery import delivery_queue
+from broadcast import broadcaster
+from premium_expiry import expiry_scheduler
 
 ppath = "plugins/*.py"
 files = glob.glob(ppath)
@@ -61,15 +69,25 @@ class Bot(Client):
             sleep_threshold=5
         )
 
+    async def invoke(self, query, retries=Session.MAX_RETRIES, timeout=Session.WAIT_TIMEOUT, sleep_threshold=None):
+        """Route every outgoing message through the shared send scheduler."""
+        chat_id = query_chat_id(query)
+        if chat_id is None:
+            return await super().invoke(query, retries, timeout, sleep_threshold)
+        
+        # Let every FloodWait through so the scheduler can adapt its rate; it waits
+        # out the short ones itself, as pyrogram would below sleep_threshold
+        threshold = self.sleep_threshold if sleep_threshold is None else sleep_threshold
+        invoke = super().invoke
+        return await send_scheduler.run(chat_id, lambda: invoke(query, retries, timeout, 0), threshold)
+
     async def start(self):
         await super().start()
-        me = await self.get_me()
+        temp.BOT = self
+        # Fills the identity cache (temp.ME_USER, ME, U_NAME, B_NAME) used by every plugin
+        me = await get_bot_me(self)
         if me:
             logging.info(f"Pyrogram client initialized. Bot ID: {me.id}, Username: @{me.username}")
-            temp.BOT = self
-            temp.ME = me.id
-            temp.U_NAME = me.username
-            temp.B_NAME = me.first_name
         else:
             logging.error("Failed to get bot details (self.get_me() returned None). Check API_ID, API_HASH, BOT_TOKEN.")
             # You might want to stop the bot here or handle this more gracefully
@@ -77,16 +95,66 @@ class Bot(Client):
         
         print(f"Bot Started as {me.first_name}")
         
+        # Build any missing indexes in the background; queries work (just slower) meanwhile
+        self.index_task = asyncio.create_task(ensure_indexes())
+        
+        # Fill the lowercase username field used by username lookups
+        try:
+            backfilled = await db.backfill_usernames()
+            if backfilled:
+                logging.info(f"Backfilled lowercase usernames for {backfilled} users")
+        except Exception as e:
+            logging.error(f"Failed to backfill usernames: {e}")
+        
+        # Broadcasts only select users flagged reachable: True
+        try:
+            backfilled = await db.backfill_reachable()
+            if backfilled:
+                logging.info(f"Marked {backfilled} existing users reachable")
+        except Exception as e:
+            logging.error(f"Failed to backfill reachable flags: {e}")
+        
+        # Build the in-memory course search index
+        try:
+            indexed = await load_search_index()
+            logging.info(f"Indexed {indexed} courses for search")
+        except Exception as e:
+            logging.error(f"Failed to build course search index, falling back to regex search: {e}")
+        
+        # Cache the most downloaded courses so their first opens skip the database
+        try:
+            warmed = await warm_course_cache(COURSE_CACHE_WARM)
+            logging.info(f"Cached {warmed} popular courses")
+        except Exception as e:
+            logging.error(f"Failed to warm course cache: {e}")
+        
         # Load banned users and chats
         b_users, b_chats = await db.get_banned()
-        temp.BANNED_USERS = b_users
-        temp.BANNED_CHATS = b_chats
+        membership.load(banned_users=[user["_id"] for user in b_users], banned_chats=[chat["_id"] for chat in b_chats])
         
         # Load premium users if premium feature is enabled
         if PREMIUM_ENABLED:
             premium_users = await db.get_premium_users()
-            temp.PREMIUM_USERS = [user["_id"] for user in premium_users]
-            logging.info(f"Loaded {len(temp.PREMIUM_USERS)} premium users")
+            membership.load(premium_users=[user["_id"] for user in premium_users])
+            logging.info(f"Loaded {len(membership.premium_users)} premium users")
+            
+            # Expire subscriptions as their deadlines pass
+            try:
+                await expiry_scheduler.start()
+            except Exception as e:
+                logging.error(f"Failed to start premium expiry scheduler: {e}")
+        
+        # Start delivering queued courses, picking up any cut short by a restart
+        try:
+            await delivery_queue.start(self)
+        except Exception as e:
+            logging.error(f"Failed to start delivery queue: {e}")
+        
+        # Resume broadcasts that were running before a restart
+        try:
+            await broadcaster.start(self)
+        except Exception as e:
+            logging.error(f"Failed to resume broadcasts: {e}")
         
         # Send startup message to log channel
         tz = pytz.timezone('Asia/Kolkata')
@@ -122,6 +190,9 @@ class Bot(Client):
 
     async def stop_custom(self, *args):
         logging.info("Executing custom stop actions...")
+        await delivery_queue.stop()
+        await broadcaster.stop()
+        await expiry_scheduler.stop()
         await super().stop()
         logging.info("Pyrogram client stopped.")
         print("Bot Stopped Gracefully!")
@@ -0,0 +1,283 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pyrogram.errors import UserIsBlocked, InputUserDeactivated, MessageNotModified
+from database.users_chats_db import db
+from database.broadcast_db import (
+    get_broadcast, update_broadcast, set_broadcast_status, save_broadcast_progress,
+    get_running_broadcasts, PENDING, RUNNING, PAUSED, CANCELLED, DONE
+)
+from info import BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE
+from retry import retry_policy, RetryStats
+from utils import get_readable_time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Seconds between status message updates
+STATUS_INTERVAL = 5
+
+STATUS_TITLES = {
+    RUNNING: "📢 Broadcasting in progress...",
+    PAUSED: "⏸ Broadcast paused",
+    CANCELLED: "❌ Broadcast cancelled",
+    DONE: "✅ Broadcast Completed!"
+}
+
+def broadcast_buttons(job_id, status):
+    """Return the control buttons for a broadcast in the given state."""
+    if status == RUNNING:
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("⏸ Pause", callback_data=f"broadcast_pause_{job_id}"),
+            InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast_cancel_{job_id}")
+        ]])
+    if status == PAUSED:
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("▶️ Resume", callback_data=f"broadcast_resume_{job_id}"),
+            InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast_cancel_{job_id}")
+        ]])
+    return None
+
+def format_progress(job, rate=0.0):
+    """Build the status text for a broadcast."""
+    processed = job['sent'] + job['failed']
+    remaining = max(job['total'] - processed, 0)
+    text = (
+        f"{STATUS_TITLES.get(job['status'], job['status'])}\n\n"
+        f"Job: `{job['_id']}`\n"
+        f"Progress: {processed}/{job['total']}\n"
+        f"Success: {job['sent']}\n"
+        f"Retried: {job['retried']}\n"
+        f"Failed: {job['failed']}"
+    )
+    if job['status'] == PAUSED and job.get('error'):
+        text += f"\nStopped by an error: {job['error']}"
+    if job['status'] == RUNNING:
+        eta = get_readable_time(remaining / rate) if rate else "calculating..."
+        text += f"\nSpeed: {rate:.1f} msgs/s\nETA: {eta}"
+    if job['errors']:
+        top_errors = sorted(job['errors'].items(), key=lambda item: item[1], reverse=True)[:5]
+        text += "\n\nErrors:\n" + "\n".join(f"• {name}: {count}" for name, count in top_errors)
+    return text
+
+class FairSlots:
+    """Concurrency slots shared round-robin between broadcasts.
+    
+    When slots are scarce, each release hands the slot to the next broadcast
+    in turn, so concurrent broadcasts progress at the same pace.
+    """
+
+    def __init__(self, slots):
+        self.free = slots
+        self._waiters = OrderedDict()  # job_id -> deque of futures
+
+    async def acquire(self, job_id):
+        if self.free > 0 and not self._waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            job_id, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(job_id)
+            else:
+                del self._waiters[job_id]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+class Broadcaster:
+    """Runs broadcasts: streams user ids in batches and sends with bounded concurrency.
+
+    Progress is checkpointed after every batch, so running broadcasts resume
+    where they left off after a restart.
+    """
+
+    def __init__(self, concurrency=BROADCAST_CONCURRENCY, batch_size=BROADCAST_BATCH_SIZE):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._slots = FairSlots(concurrency)
+        self._tasks = {}
+        self._bot = None
+
+    async def start(self, bot):
+        """Resume broadcasts that were running when the bot stopped."""
+        self._bot = bot
+        for job in await get_running_broadcasts():
+            logger.info(f"Resuming broadcast {job['_id']}")
+            self._spawn(job['_id'])
+
+    async def stop(self):
+        """Stop the running broadcasts; they stay marked running and resume on the next start."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, job_id):
+        if job_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def confirm(self, job_id, chat_id, message_id):
+        """Start a pending broadcast, reporting progress in the given message."""
+        if not await set_broadcast_status(job_id, RUNNING, [PENDING]):
+            return False
+        await update_broadcast(
+            job_id,
+            chat_id=chat_id,
+            message_id=message_id,
+            total=await db.get_reachable_user_count()
+        )
+        self._spawn(job_id)
+        return True
+
+    async def pause(self, job_id):
+        """Pause a running broadcast after its current batch."""
+        return await set_broadcast_status(job_id, PAUSED, [RUNNING])
+
+    async def resume(self, job_id):
+        """Resume a paused broadcast from its last checkpoint."""
+        if not await set_broadcast_status(job_id, RUNNING, [PAUSED]):
+            return False
+        await update_broadcast(job_id, error=None)
+        self._spawn(job_id)
+        return True
+
+    async def cancel(self, job_id):
+        """Cancel a broadcast that hasn't finished yet."""
+        return await set_broadcast_status(job_id, CANCELLED, [PENDING, RUNNING, PAUSED])
+
+    def is_running(self, job_id):
+        """Return True while a task is sending the broadcast (and keeping its message current)."""
+        return job_id in self._tasks
+
+    async def _send(self, job, user_id, retry_stats, unreachable):
+        try:
+            if job.get('source_message_id'):
+                await retry_policy.call(self._bot.copy_message, user_id, job['from_chat_id'], job['source_message_id'], stats=retry_stats)
+            else:
+                await retry_policy.call(self._bot.send_message, user_id, job['text'], stats=retry_stats)
+            job['sent'] += 1
+            return
+        except UserIsBlocked as e:
+            error = e
+            unreachable[user_id] = "User blocked the bot"
+        except InputUserDeactivated as e:
+            error = e
+            unreachable[user_id] = "User account deleted"
+        except Exception as e:
+            error = e
+            logger.error(f"Error in broadcast: {e}")
+        job['failed'] += 1
+        name = type(error).__name__
+        job['errors'][name] = job['errors'].get(name, 0) + 1
+
+    async def _show(self, job, rate=0.0):
+        if not job.get('message_id'):
+            return
+        try:
+            await self._bot.edit_message_text(
+                job['chat_id'],
+                job['message_id'],
+                format_progress(job, rate),
+                reply_markup=broadcast_buttons(job['_id'], job['status'])
+            )
+        except MessageNotModified:
+            pass
+        except Exception as e:
+            logger.error(f"Error updating broadcast status: {e}")
+
+    async def _run(self, job_id):
+        job = await get_broadcast(job_id)
+        if not job or job['status'] != RUNNING:
+            return
+
+        retry_stats = RetryStats()
+        retried_before = job['retried']
+        processed_before = job['sent'] + job['failed']
+        # Users found dead during the current batch, flagged in one bulk write
+        unreachable = {}
+
+        async def send(user_id):
+            await self._slots.acquire(job_id)
+            try:
+                await self._send(job, user_id, retry_stats, unreachable)
+            finally:
+                self._slots.release()
+
+        started = time.monotonic()
+        last_status = 0
+        rate = 0.0
+        try:
+            await self._show(job)
+            while True:
+                batch = await db.get_user_id_batch(after=job['last_user_id'], limit=self.batch_size)
+                if not batch:
+                    await set_broadcast_status(job_id, DONE, [RUNNING])
+                    job['status'] = DONE
+                    break
+
+                sends = [asyncio.create_task(send(user_id)) for user_id in batch]
+                try:
+                    await asyncio.gather(*sends)
+                finally:
+                    # On error or shutdown, stop the rest of the batch so their slots are released
+                    for task in sends:
+                        task.cancel()
+                    await asyncio.gather(*sends, return_exceptions=True)
+                job['last_user_id'] = batch[-1]
+                job['retried'] = retried_before + retry_stats.retried
+                if unreachable:
+                    try:
+                        await db.mark_unreachable(unreachable)
+                    except Exception as e:
+                        logger.error(f"Error flagging unreachable users: {e}")
+                    unreachable.clear()
+                await save_broadcast_progress(job_id, job['last_user_id'], job['sent'], job['failed'], job['retried'], job['errors'])
+
+                # Pick up pause/cancel requests made while the batch was sending
+                current = await get_broadcast(job_id)
+                if not current or current['status'] != RUNNING:
+                    job['status'] = current['status'] if current else CANCELLED
+                    break
+
+                now = time.monotonic()
+                rate = (job['sent'] + job['failed'] - processed_before) / max(now - started, 1e-6)
+                if now - last_status >= STATUS_INTERVAL:
+                    await self._show(job, rate)
+                    last_status = now
+        except asyncio.CancelledError:
+            # The bot is stopping; the broadcast stays running and resumes on the next start
+            raise
+        except Exception as e:
+            # Pause rather than fail, so the admin can resume from the last checkpoint
+            logger.error(f"Broadcast {job_id} stopped by an error: {e}")
+            job['status'] = PAUSED
+            job['error'] = str(e)
+            try:
+                if await set_broadcast_status(job_id, PAUSED, [RUNNING]):
+                    await update_broadcast(job_id, error=job['error'])
+            except Exception as e:
+                logger.error(f"Error pausing broadcast {job_id}: {e}")
+
+        await self._show(job, rate)
+        logger.info(f"Broadcast {job_id} {job['status']}: {job['sent']} sent, {job['failed']} failed")
+
+broadcaster = Broadcaster()
@@ -0,0 +1,76 @@
+import logging
+from datetime import datetime
+from info import DATABASE_URI, DATABASE_NAME, BROADCAST_COLLECTION
+from .db_helpers import get_mongo_client
+
+logger = logging.getLogger(__name__)
+
+client = get_mongo_client(DATABASE_URI)
+db = client[DATABASE_NAME]
+broadcasts_col = db[BROADCAST_COLLECTION]
+
+# Broadcast states
+PENDING = "pending"      # waiting for the admin to confirm
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
+
+async def create_broadcast(admin_id, text=None, from_chat_id=None, source_message_id=None):
+    """Store a new broadcast awaiting confirmation and return its id.
+    
+    A broadcast either sends text, or copies the message source_message_id
+    from from_chat_id (any media, without re-uploading it).
+    """
+    now = datetime.now()
+    result = await broadcasts_col.insert_one({
+        'admin_id': admin_id,
+        'text': text,
+        'from_chat_id': from_chat_id,
+        'source_message_id': source_message_id,
+        'status': PENDING,
+        'last_user_id': None,
+        'total': 0,
+        'sent': 0,
+        'failed': 0,
+        'retried': 0,
+        'errors': {},
+        'created_at': now,
+        'updated_at': now
+    })
+    return result.inserted_id
+
+async def get_broadcast(job_id):
+    """Get a broadcast by id."""
+    return await broadcasts_col.find_one({'_id': job_id})
+
+async def update_broadcast(job_id, **fields):
+    """Set fields on a broadcast."""
+    fields['updated_at'] = datetime.now()
+    await broadcasts_col.update_one({'_id': job_id}, {'$set': fields})
+
+async def set_broadcast_status(job_id, status, from_statuses):
+    """Move a broadcast to status if it is currently in one of from_statuses.
+
+    Returns True if the status changed.
+    """
+    result = await broadcasts_col.update_one(
+        {'_id': job_id, 'status': {'$in': list(from_statuses)}},
+        {'$set': {'status': status, 'updated_at': datetime.now()}}
+    )
+    return result.modified_count > 0
+
+async def save_broadcast_progress(job_id, last_user_id, sent, failed, retried, errors):
+    """Checkpoint a running broadcast after a batch of users."""
+    await update_broadcast(
+        job_id,
+        last_user_id=last_user_id,
+        sent=sent,
+        failed=failed,
+        retried=retried,
+        errors=errors
+    )
+
+async def get_running_broadcasts():
+    """Return broadcasts that were running, e.g. when the bot restarted."""
+    return await broadcasts_col.find({'status': RUNNING}).to_list(length=None)
@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """A size-bounded LRU mapping with an optional TTL and hit/miss counters.
+    
+    With weigh(value), max_size bounds the total weight of the entries
+    instead of their number.
+    """
+    
+    def __init__(self, max_size=1000, ttl=None, weigh=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.weigh = weigh
+        self.weight = 0
+        self._data = OrderedDict()  # key -> (value, expires_at, weight)
+        self.hits = 0
+        self.misses = 0
+        
+    def __len__(self):
+        return len(self._data)
+        
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+        
+    def get(self, key, default=None, count=True):
+        """Return the cached value for key, or default if missing or expired."""
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at, _ = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            self._remove(key)
+        if count:
+            self.misses += 1
+        return default
+        
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        weight = self.weigh(value) if self.weigh else 1
+        self._remove(key)
+        self._data[key] = (value, expires_at, weight)
+        self.weight += weight
+        # The newest entry is always kept, even if it alone exceeds max_size
+        while self.weight > self.max_size and len(self._data) > 1:
+            self._remove(next(iter(self._data)))
+            
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+        return entry
+            
+    def pop(self, key, default=None):
+        """Remove and return a cached value."""
+        entry = self._remove(key)
+        return entry[0] if entry is not None else default
+        
+    def clear(self):
+        """Drop every entry."""
+        self._data.clear()
+        self.weight = 0
+        
+    def stats(self):
+        """Return size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "weight": self.weight,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+_MISSING = object()
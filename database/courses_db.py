@@ -1,22 +1,72 @@
 import re
-from struct import pack
-from pymongo import MongoClient
+from collections import namedtuple
+from types import MappingProxyType
+from bson import ObjectId
+from bson.errors import InvalidId
 from pymongo.errors import DuplicateKeyError
-from info import DATABASE_URI, DATABASE_NAME, COURSES_COLLECTION, FILES_COLLECTION
+from info import DATABASE_URI, DATABASE_NAME, COURSES_COLLECTION, FILES_COLLECTION, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, COURSE_CACHE_FILES
 from .db_helpers import get_mongo_client
+from .search_index import course_index, tokenize, can_narrow
+from .cache import LRUCache
 
 client = get_mongo_client(DATABASE_URI)
 db = client[DATABASE_NAME]
 courses_col = db[COURSES_COLLECTION]
 files_col = db[FILES_COLLECTION]
 
+# Callbacks run with a course_id whenever that course is created, changed or deleted
+_course_listeners = []
+
+# Whether the deployment is a replica set or sharded cluster, checked on first publish
+_transactions_supported = None
+
+# Course, file and storage totals: aggregated once, then kept current by the write paths
+_catalog_stats = None
+
+# A course and its files, ordered by file_order, as read-only mappings
+CourseSnapshot = namedtuple('CourseSnapshot', ['version', 'course', 'files'])
+
+# course_id -> CourseSnapshot, bounded by the total number of files held
+_snapshot_cache = LRUCache(max_size=COURSE_CACHE_FILES, weigh=lambda snapshot: len(snapshot.files) + 1)
+
+# course_id -> version, bumped on every mutation so loads that raced one aren't cached
+_course_versions = {}
+
+# Normalized query -> RankedResult, cleared on every catalog mutation
+_search_cache = LRUCache(max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+_search_prefix_hits = 0
+
+def add_course_listener(callback):
+    """Register a callback(course_id) invoked on every catalog mutation."""
+    if callback not in _course_listeners:
+        _course_listeners.append(callback)
+
+def _course_changed(course_id):
+    """Notify listeners that a course was created, changed or deleted."""
+    _search_cache.clear()
+    _course_versions[course_id] = _course_versions.get(course_id, 0) + 1
+    _snapshot_cache.pop(course_id)
+    for callback in _course_listeners:
+        try:
+            callback(course_id)
+        except Exception as e:
+            print(f"Error in course listener: {e}")
+
+async def _supports_transactions():
+    """Return True if the server supports multi-document transactions."""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await client.admin.command('hello')
+        _transactions_supported = bool(hello.get('setName')) or hello.get('msg') == 'isdbgrid'
+    return _transactions_supported
+
 async def save_course(course_data):
     """Save a new course in the database."""
-    if courses_col.find_one({'course_id': course_data['course_id']}):
-        return False, 0
-    
     try:
-        courses_col.insert_one(course_data)
+        await courses_col.insert_one(course_data)
+        course_index.add(course_data)
+        _adjust_catalog_stats(1, 0, 0)
+        _course_changed(course_data['course_id'])
         return True, 1
     except DuplicateKeyError:
         return False, 0
@@ -24,10 +74,47 @@ async def save_course(course_data):
         print(f"Error saving course: {e}")
         return False, 0
 
+async def save_course_with_files(course_data, files):
+    """Save a new course and all of its files in two writes.
+    
+    Runs in a transaction when the deployment supports it; otherwise a failed
+    file insert removes what was written, so a course is never left half-saved.
+    Returns False if the course_id already exists or the write failed.
+    """
+    course_id = course_data['course_id']
+    try:
+        if await _supports_transactions():
+            async with await client.start_session() as session:
+                async with session.start_transaction():
+                    await courses_col.insert_one(course_data, session=session)
+                    if files:
+                        await files_col.insert_many(files, session=session)
+        else:
+            await courses_col.insert_one(course_data)
+            try:
+                if files:
+                    await files_col.insert_many(files)
+            except Exception:
+                await files_col.delete_many({'course_id': course_id})
+                await courses_col.delete_one({'course_id': course_id})
+                raise
+    except DuplicateKeyError:
+        return False
+    except Exception as e:
+        print(f"Error saving course with files: {e}")
+        return False
+    
+    course_index.add(course_data)
+    _adjust_catalog_stats(1, len(files), sum(file.get('file_size', 0) for file in files))
+    _course_changed(course_id)
+    return True
+
 async def save_course_file(file_data):
     """Save a file related to a course."""
     try:
-        files_col.insert_one(file_data)
+        await files_col.insert_one(file_data)
+        _adjust_catalog_stats(0, 1, file_data.get('file_size', 0))
+        _course_changed(file_data['course_id'])
         return True
     except Exception as e:
         print(f"Error saving course file: {e}")
@@ -35,24 +122,132 @@ async def save_course_file(file_data):
 
 async def get_course_by_id(course_id):
     """Get course details by course ID."""
-    return courses_col.find_one({'course_id': course_id})
+    return await courses_col.find_one({'course_id': course_id})
 
 async def get_course_by_name(course_name):
     """Get course by name (exact match)."""
-    return courses_col.find_one({'course_name': course_name})
+    return await courses_col.find_one({'course_name': course_name})
 
 async def get_course_files(course_id):
     """Get all files related to a course by course ID."""
-    files = []
     cursor = files_col.find({'course_id': course_id}).sort('file_order', 1)
-    for file in cursor:
-        files.append(file)
-    return files
+    return await cursor.to_list(length=None)
+
+def _make_snapshot(version, course, files):
+    return CourseSnapshot(version, MappingProxyType(course), tuple(MappingProxyType(file) for file in files))
+
+async def get_course_snapshot(course_id):
+    """Get a course and its ordered files through the snapshot cache, or None if not found."""
+    version = _course_versions.get(course_id, 0)
+    snapshot = _snapshot_cache.get(course_id)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    
+    course = await get_course_by_id(course_id)
+    if not course:
+        return None
+    snapshot = _make_snapshot(version, course, await get_course_files(course_id))
+    if _course_versions.get(course_id, 0) == version:
+        _snapshot_cache.set(course_id, snapshot)
+    return snapshot
+
+async def warm_course_cache(limit):
+    """Load snapshots of the most downloaded courses. Returns the number cached."""
+    versions = dict(_course_versions)
+    courses = await courses_col.find().sort('download_count', -1).limit(limit).to_list(length=limit)
+    if not courses:
+        return 0
+    files = {course['course_id']: [] for course in courses}
+    cursor = files_col.find({'course_id': {'$in': list(files)}}).sort([('course_id', 1), ('file_order', 1)])
+    async for file in cursor:
+        files[file['course_id']].append(file)
+    for course in courses:
+        course_id = course['course_id']
+        version = versions.get(course_id, 0)
+        if _course_versions.get(course_id, 0) == version:
+            _snapshot_cache.set(course_id, _make_snapshot(version, course, files[course_id]))
+    return len(courses)
 
-async def search_courses(query, max_results=10, offset=0):
-    """Search for courses by name."""
+def get_course_cache_stats():
+    """Get size and hit/miss counters for the course snapshot cache."""
+    return _snapshot_cache.stats()
+
+async def load_search_index():
+    """Build the in-memory course name index from the database."""
+    course_index.clear()
+    async for course in courses_col.find().sort('_id', 1):
+        course_index.add(course)
+    course_index.ready = True
+    return len(course_index)
+
+def _encode_cursor(score, object_id):
+    """Encode a (score, _id) ranking key as an inline-query offset string."""
+    return f"{score!r}:{object_id}"
+
+def _decode_cursor(cursor):
+    """Decode an offset string produced by _encode_cursor, or None if invalid."""
+    try:
+        score, object_id = cursor.split(':', 1)
+        return float(score), ObjectId(object_id)
+    except (ValueError, InvalidId):
+        return None
+
+async def search_courses(query, max_results=10, offset=0, fuzzy=False):
+    """Search for courses by name (fuzzy=True tolerates typos in query words).
+    
+    ``offset`` is either a number of results to skip or the ``next_offset``
+    cursor returned by a previous call, which pages by key instead of skipping.
+    """
     query = query.strip()
+    after = None
+    if isinstance(offset, str):
+        after = _decode_cursor(offset) if offset else None
+        offset = 0
     
+    if course_index.ready:
+        ranked = _ranked_courses(query, fuzzy)
+        courses, total_results, next_key = course_index.page(ranked, max_results, offset, after)
+        next_offset = _encode_cursor(*next_key) if next_key else ""
+        return courses, next_offset, total_results
+    
+    return await _regex_search_courses(query, max_results, offset, after)
+
+def _ranked_courses(query, fuzzy):
+    """Rank a query through the search cache."""
+    global _search_prefix_hits
+    terms = tokenize(query)
+    normalized = ' '.join(terms)
+    ranked = _search_cache.get((normalized, fuzzy))
+    if ranked is not None:
+        return ranked
+    
+    # While a user types "caro k", narrow the cached result for "caro" instead of
+    # searching the whole catalog. Only strict results can be narrowed this way.
+    for end in range(len(normalized) - 1, 0, -1):
+        broader_query = normalized[:end].rstrip()
+        broader = _search_cache.get((broader_query, fuzzy), count=False)
+        if broader is None or broader.used_fuzzy or not can_narrow(tokenize(broader_query), terms):
+            continue
+        ranked = course_index.rank_within(normalized, broader)
+        break
+    # An empty narrowed result is final for strict searches, but a fuzzy search
+    # may still find typo matches that the strict result can't contain
+    if ranked is not None and (ranked or not fuzzy):
+        _search_prefix_hits += 1
+    else:
+        ranked = course_index.rank(normalized, fuzzy)
+    
+    _search_cache.set((normalized, fuzzy), ranked)
+    return ranked
+
+def get_search_cache_stats():
+    """Get hit/miss counters for the search result cache."""
+    stats = _search_cache.stats()
+    stats["prefix_hits"] = _search_prefix_hits
+    return stats
+
+async def _regex_search_courses(query, max_results, offset, after=None):
+    """Search for courses with a regex scan (used until the index is built)."""
     if not query:
         raw_pattern = '.'
     elif ' ' not in query:
@@ -66,22 +261,37 @@ async def search_courses(query, max_results=10, offset=0):
         regex = query
         
     filter = {'course_name': regex}
+    total_results = await courses_col.count_documents(filter)
     
-    courses = []
-    cursor = courses_col.find(filter).sort('$natural', -1).skip(offset).limit(max_results)
+    # Page on _id (newest first) so deep pages don't pay for skip()
+    if after is not None:
+        filter['_id'] = {'$lt': after[1]}
+    cursor = courses_col.find(filter).sort('_id', -1).skip(offset).limit(max_results + 1)
+    courses = await cursor.to_list(length=max_results + 1)
     
-    for course in cursor:
-        courses.append(course)
-        
-    total_results = courses_col.count_documents(filter)
-    next_offset = "" if (offset + max_results) >= total_results else (offset + max_results)
+    next_offset = ""
+    if len(courses) > max_results:
+        courses = courses[:max_results]
+        next_offset = _encode_cursor(0.0, courses[-1]['_id'])
     
     return courses, next_offset, total_results
 
+async def record_course_download(course_id):
+    """Count a full course delivery towards the course's popularity."""
+    try:
+        await courses_col.update_one({'course_id': course_id}, {'$inc': {'download_count': 1}})
+        course_index.record_download(course_id)
+        return True
+    except Exception as e:
+        print(f"Error recording course download: {e}")
+        return False
+
 async def update_course(course_id, update_data):
     """Update a course's details."""
     try:
-        courses_col.update_one({'course_id': course_id}, {'$set': update_data})
+        await courses_col.update_one({'course_id': course_id}, {'$set': update_data})
+        course_index.update(course_id, update_data)
+        _course_changed(course_id)
         return True
     except Exception as e:
         print(f"Error updating course: {e}")
@@ -90,22 +300,45 @@ async def update_course(course_id, update_data):
 async def delete_course(course_id):
     """Delete a course and all its files."""
     try:
-        courses_col.delete_one({'course_id': course_id})
-        files_col.delete_many({'course_id': course_id})
+        course = await courses_col.find_one_and_delete({'course_id': course_id})
+        result = await files_col.delete_many({'course_id': course_id})
+        _adjust_catalog_stats(-1 if course else 0, -result.deleted_count, -(course or {}).get('total_size', 0))
+        course_index.remove(course_id)
+        _course_changed(course_id)
         return True
     except Exception as e:
         print(f"Error deleting course: {e}")
         return False
 
+def _adjust_catalog_stats(courses, files, storage):
+    """Apply a change to the catalog totals, if they've been loaded."""
+    if _catalog_stats is not None:
+        _catalog_stats['courses'] += courses
+        _catalog_stats['files'] += files
+        _catalog_stats['storage'] += storage
+
+async def get_catalog_stats():
+    """Return {'courses', 'files', 'storage'} totals, computed server-side on first use."""
+    global _catalog_stats
+    if _catalog_stats is None:
+        courses = await courses_col.count_documents({})
+        totals = {'files': 0, 'storage': 0}
+        async for row in files_col.aggregate([
+            {'$group': {'_id': None, 'files': {'$sum': 1}, 'storage': {'$sum': '$file_size'}}}
+        ]):
+            totals = row
+        _catalog_stats = {'courses': courses, 'files': totals['files'], 'storage': totals['storage']}
+    return dict(_catalog_stats)
+
 async def get_all_courses(max_results=100, offset=0):
     """Get all courses with pagination."""
     courses = []
     cursor = courses_col.find().sort('$natural', -1).skip(offset).limit(max_results)
     
-    for course in cursor:
+    async for course in cursor:
         courses.append(course)
         
-    total_results = courses_col.count_documents({})
+    total_results = await courses_col.count_documents({})
     next_offset = "" if (offset + max_results) >= total_results else (offset + max_results)
     
     return courses, next_offset, total_results 
\ No newline at end of file
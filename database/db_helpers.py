@@ -1,29 +1,126 @@
-from pymongo import MongoClient
-import ssl
+import time
+import threading
 import logging
+import motor.motor_asyncio
+from pymongo import monitoring
+from info import MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_COMPRESSORS, MONGO_READ_PREFERENCE
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collect connection pool checkout wait times for sizing the pool."""
+    
+    def __init__(self):
+        # Motor runs pymongo calls on worker threads; check-out start and
+        # completion always happen on the same thread.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.connections = 0
+        
+    def _record_wait(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+        
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        
+    def connection_checked_out(self, event):
+        wait = self._record_wait()
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            
+    def connection_check_out_failed(self, event):
+        self._record_wait()
+        with self._lock:
+            self.failed_checkouts += 1
+            
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+            
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+            
+    def connection_checked_in(self, event):
+        pass
+        
+    def connection_ready(self, event):
+        pass
+        
+    def pool_created(self, event):
+        pass
+        
+    def pool_ready(self, event):
+        pass
+        
+    def pool_cleared(self, event):
+        pass
+        
+    def pool_closed(self, event):
+        pass
+        
+    def snapshot(self):
+        """Return the current pool statistics as a dict."""
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "failed_checkouts": self.failed_checkouts,
+                "avg_wait_ms": (self.total_wait / self.checkouts * 1000) if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+                "open_connections": self.connections
+            }
+
+pool_stats = PoolStatsListener()
+
+# One client (and therefore one connection pool) per URI for the whole process
+_clients = {}
+
+def _client_options(uri):
+    """Build the pool, compression and read preference options for a client."""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "event_listeners": [pool_stats]
+    }
+    if MONGO_MAX_IDLE_TIME_MS > 0:
+        options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+    compressors = [c.strip() for c in MONGO_COMPRESSORS.split(",") if c.strip()]
+    if compressors:
+        options["compressors"] = compressors
+    if uri.startswith('mongodb+srv://'):
+        # For SRV URIs, enable TLS and allow invalid certificates if that's the intended behavior
+        # (equivalent to ssl_cert_reqs=ssl.CERT_NONE).
+        # Consider if you truly need to bypass certificate verification in production.
+        options["tls"] = True
+        options["tlsAllowInvalidCertificates"] = True
+    return options
+
 def get_mongo_client(uri):
-    """Create and return a MongoDB client with proper settings."""
+    """Return the shared asyncio (Motor) MongoDB client for a URI, creating it once."""
+    client = _clients.get(uri)
+    if client is not None:
+        return client
     try:
-        if uri.startswith('mongodb+srv://'):
-            # For SRV URIs, enable TLS and allow invalid certificates if that's the intended behavior
-            # (equivalent to ssl_cert_reqs=ssl.CERT_NONE).
-            # Consider if you truly need to bypass certificate verification in production.
-            client = MongoClient(uri, tls=True, tlsAllowInvalidCertificates=True)
-        else:
-            client = MongoClient(uri)
+        client = motor.motor_asyncio.AsyncIOMotorClient(uri, **_client_options(uri))
+        _clients[uri] = client
         return client
     except Exception as e:
         logger.error(f"Error connecting to MongoDB: {e}")
         raise e
+
+def get_pool_stats():
+    """Get connection pool checkout statistics for all shared clients."""
+    stats = pool_stats.snapshot()
+    stats["clients"] = len(_clients)
+    return stats
         
-def calculate_used_storage(collection):
-    """Calculate the total used storage in a collection in bytes."""
-    total_size = 0
-    for doc in collection.find():
-        if 'file_size' in doc:
-            total_size += doc.get('file_size', 0)
-    return total_size 
\ No newline at end of file
@@ -0,0 +1,106 @@
+import logging
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from info import DATABASE_URI, DATABASE_NAME, DELIVERY_COLLECTION, STATS_CACHE_TTL
+from .db_helpers import get_mongo_client
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+client = get_mongo_client(DATABASE_URI)
+db = client[DATABASE_NAME]
+jobs_col = db[DELIVERY_COLLECTION]
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_stats_cache = LRUCache(max_size=1, ttl=STATS_CACHE_TTL)
+
+async def enqueue_delivery(user_id, chat_id, course_id):
+    """Queue a course delivery, unless one is already queued for this user and course.
+
+    Returns the id of the new job, or None if an active one already existed.
+    """
+    now = datetime.now()
+    result = await jobs_col.update_one(
+        {'user_id': user_id, 'course_id': course_id, 'status': {'$in': [PENDING, RUNNING]}},
+        {'$setOnInsert': {
+            'chat_id': chat_id,
+            'status': PENDING,
+            'cursor': 0,
+            'sent': 0,
+            'failed': 0,
+            'created_at': now,
+            'updated_at': now
+        }},
+        upsert=True
+    )
+    return result.upserted_id
+
+async def claim_next_job():
+    """Atomically mark the oldest pending job as running and return it."""
+    return await jobs_col.find_one_and_update(
+        # Deferred jobs wait until their run_after time
+        {'status': PENDING, 'run_after': {'$not': {'$gt': datetime.now()}}},
+        {'$set': {'status': RUNNING, 'updated_at': datetime.now()}},
+        sort=[('created_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def checkpoint_job(job_id, cursor, sent, failed):
+    """Record how far a running job has got."""
+    await jobs_col.update_one(
+        {'_id': job_id},
+        {'$set': {'cursor': cursor, 'sent': sent, 'failed': failed, 'updated_at': datetime.now()}}
+    )
+
+async def defer_job(job_id, seconds):
+    """Put a claimed job back in the queue, not to be claimed again for `seconds`."""
+    now = datetime.now()
+    await jobs_col.update_one(
+        {'_id': job_id},
+        {'$set': {'status': PENDING, 'run_after': now + timedelta(seconds=seconds), 'updated_at': now}}
+    )
+
+async def finish_job(job_id, status=DONE, error=None):
+    """Mark a running job as done or failed. It is deleted DELIVERY_JOB_RETENTION days later.
+
+    Returns False if the job wasn't running, e.g. it was already finished.
+    """
+    now = datetime.now()
+    update = {'status': status, 'updated_at': now, 'finished_at': now}
+    if error:
+        update['error'] = error
+    result = await jobs_col.update_one({'_id': job_id, 'status': RUNNING}, {'$set': update})
+    return result.modified_count > 0
+
+async def requeue_interrupted_jobs():
+    """Put jobs that were running when the bot stopped back in the queue."""
+    result = await jobs_col.update_many({'status': RUNNING}, {'$set': {'status': PENDING}})
+    return result.modified_count
+
+async def stamp_finished_jobs():
+    """Give jobs finished before finished_at existed one, so the TTL index can expire them."""
+    result = await jobs_col.update_many(
+        {'status': {'$in': [DONE, FAILED]}, 'finished_at': {'$exists': False}},
+        [{'$set': {'finished_at': '$updated_at'}}]
+    )
+    return result.modified_count
+
+async def get_queue_stats():
+    """Return the number of jobs in each state, reusing the last counts for STATS_CACHE_TTL seconds.
+
+    Done and failed cover the DELIVERY_JOB_RETENTION window.
+    """
+    stats = _stats_cache.get("stats")
+    if stats is not None:
+        return stats
+    stats = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+    for status in stats:
+        # Each count is answered from the (status, created_at) index
+        stats[status] = await jobs_col.count_documents({'status': status})
+    _stats_cache.set("stats", stats)
+    return stats
@@ -0,0 +1,90 @@
+import logging
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from info import STATS_CACHE_TTL, DELIVERY_JOB_RETENTION
+from .cache import LRUCache
+from .courses_db import courses_col, files_col
+from .users_chats_db import users_collection, chats_collection
+from .token_db import tokens_col
+from .delivery_db import jobs_col
+from .broadcast_db import broadcasts_col
+
+logger = logging.getLogger(__name__)
+
+# Every index the bot relies on, per collection. Names are left to MongoDB's
+# default (e.g. "course_id_1") so existing indexes are recognised.
+INDEX_REGISTRY = [
+    (courses_col, [
+        IndexModel([("course_id", ASCENDING)], unique=True),  # duplicate ids are rejected here
+        IndexModel([("course_name", ASCENDING)]),
+        IndexModel([("download_count", DESCENDING)])  # warming the course cache
+    ]),
+    (files_col, [
+        IndexModel([("course_id", ASCENDING), ("file_order", ASCENDING)])
+    ]),
+    (users_collection, [
+        IndexModel([("reachable", ASCENDING), ("_id", ASCENDING)]),  # broadcasts
+        IndexModel([("is_premium", ASCENDING), ("premium_expiry", ASCENDING)]),
+        IndexModel([("ban_status.is_banned", ASCENDING)]),
+        IndexModel([("username_lower", ASCENDING)])  # username lookups
+    ]),
+    (chats_collection, [
+        IndexModel([("ban_status.is_banned", ASCENDING)])
+    ]),
+    (tokens_col, [
+        IndexModel([("token", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+        IndexModel([("created_on", DESCENDING)])
+    ]),
+    (jobs_col, [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("course_id", ASCENDING), ("status", ASCENDING)]),
+        # Only finished jobs have finished_at, so queued and running jobs are never expired
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=DELIVERY_JOB_RETENTION * 86400)
+    ]),
+    (broadcasts_col, [
+        IndexModel([("status", ASCENDING)])
+    ])
+]
+
+_report_cache = LRUCache(max_size=1, ttl=STATS_CACHE_TTL)
+
+async def ensure_indexes():
+    """Create any missing registry indexes. Safe to run on every startup."""
+    for collection, indexes in INDEX_REGISTRY:
+        try:
+            await collection.create_indexes(indexes)
+        except Exception as e:
+            logger.error(f"Error creating indexes on {collection.name}: {e}")
+    logger.info("Index check complete")
+
+async def get_index_report():
+    """Return {'missing': [...], 'unused': [...]} as "collection.index" names.
+
+    Unused means no recorded accesses since the server last started, per $indexStats.
+    """
+    report = _report_cache.get("report")
+    if report is not None:
+        return report
+    missing = []
+    unused = []
+    for collection, indexes in INDEX_REGISTRY:
+        try:
+            existing = await collection.index_information()
+        except Exception as e:
+            logger.error(f"Error reading indexes of {collection.name}: {e}")
+            continue
+        for index in indexes:
+            name = index.document["name"]
+            if name not in existing:
+                missing.append(f"{collection.name}.{name}")
+
+        try:
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and not stats["accesses"]["ops"]:
+                    unused.append(f"{collection.name}.{stats['name']}")
+        except Exception as e:
+            # $indexStats needs extra privileges on some hosted clusters
+            logger.warning(f"Could not read index usage of {collection.name}: {e}")
+    report = {"missing": missing, "unused": unused}
+    _report_cache.set("report", report)
+    return report
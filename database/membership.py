@@ -0,0 +1,74 @@
+from info import ADMINS
+from .cache import LRUCache
+
+# Users recently found not to be premium, so repeat checks skip the database
+NOT_PREMIUM_CACHE_SIZE = 100000
+NOT_PREMIUM_TTL = 300
+
+class MembershipCache:
+    """In-memory id sets for premium users, banned users and banned chats.
+
+    Kept current by the Database write methods. Lookups are O(1) set
+    membership tests.
+    """
+
+    def __init__(self):
+        self.admins = set(ADMINS)
+        self.premium_users = set()
+        self.banned_users = set()
+        self.banned_chats = set()
+        self.not_premium = LRUCache(max_size=NOT_PREMIUM_CACHE_SIZE, ttl=NOT_PREMIUM_TTL)
+        # Updates stopped by the ban guard plugin
+        self.dropped_updates = 0
+
+    def load(self, premium_users=None, banned_users=None, banned_chats=None):
+        """Replace the sets with ids loaded from the database, in place."""
+        for target, ids in ((self.premium_users, premium_users), (self.banned_users, banned_users), (self.banned_chats, banned_chats)):
+            if ids is not None:
+                target.clear()
+                target.update(ids)
+        self.not_premium.clear()
+
+    def is_premium(self, user_id):
+        """Return True or False if the answer is cached, else None."""
+        if user_id in self.premium_users:
+            return True
+        if user_id in self.not_premium:
+            return False
+        return None
+
+    def set_premium(self, user_id, status):
+        if status:
+            self.premium_users.add(user_id)
+            self.not_premium.pop(user_id)
+        else:
+            self.premium_users.discard(user_id)
+            self.not_premium.set(user_id, True)
+
+    def expire_premium(self, user_ids):
+        self.premium_users.difference_update(user_ids)
+        for user_id in user_ids:
+            self.not_premium.set(user_id, True)
+
+    def set_banned_user(self, user_id, banned):
+        if banned:
+            self.banned_users.add(user_id)
+        else:
+            self.banned_users.discard(user_id)
+
+    def set_banned_chat(self, chat_id, banned):
+        if banned:
+            self.banned_chats.add(chat_id)
+        else:
+            self.banned_chats.discard(chat_id)
+
+    def stats(self):
+        return {
+            "premium": len(self.premium_users),
+            "banned_users": len(self.banned_users),
+            "banned_chats": len(self.banned_chats),
+            "not_premium": len(self.not_premium),
+            "dropped_updates": self.dropped_updates
+        }
+
+membership = MembershipCache()
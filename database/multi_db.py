@@ -1,7 +1,6 @@
 import logging
-from pymongo import MongoClient
-import motor.motor_asyncio
 from info import DATABASE_URI, FALLBACK_DATABASE_URI, DATABASE_NAME, MULTI_DB_ENABLED
+from .db_helpers import get_mongo_client
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -33,12 +32,8 @@ class MultiDBHandler:
             logger.error(f"Error initializing database connections: {e}")
             
     def _get_motor_client(self, uri):
-        """Get a Motor client for the given URI."""
-        return motor.motor_asyncio.AsyncIOMotorClient(uri)
-        
-    def _get_pymongo_client(self, uri):
-        """Get a PyMongo client for the given URI."""
-        return MongoClient(uri)
+        """Get the shared Motor client for the given URI."""
+        return get_mongo_client(uri)
         
     async def get_collection(self, collection_name):
         """Get a collection from the primary database."""
@@ -0,0 +1,398 @@
+import re
+import math
+import time
+import heapq
+import bisect
+import logging
+from itertools import combinations
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+# Per-term match quality
+EXACT_SCORE = 3
+PREFIX_SCORE = 2
+SUBSTRING_SCORE = 1
+FUZZY_SCORES = {1: 0.8, 2: 0.5}  # by edit distance
+
+# Fuzzy matching limits
+MIN_FUZZY_LENGTH = 4
+MAX_EDIT_DISTANCE = 2
+
+# How much recency and popularity can add on top of match quality
+RECENCY_WEIGHT = 0.25
+POPULARITY_WEIGHT = 0.25
+# A course added this many seconds before the index was built gets half the recency boost
+RECENCY_HALF_LIFE = 90 * 86400
+# Popularity is counted in doubling tiers of downloads; about 1M downloads earns the full boost
+POPULARITY_TIERS = 20
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens."""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+def can_narrow(broader_terms, terms):
+    """Return True if every strict match of terms is also a strict match of broader_terms.
+
+    Each broader term has to be a prefix of the term in the same position and
+    at least 3 characters long: shorter terms have no trigrams, so they only
+    prefix-match and their results miss infix matches of the longer term.
+    """
+    if not broader_terms or len(broader_terms) > len(terms):
+        return False
+    return all(len(broader) >= 3 and term.startswith(broader) for broader, term in zip(broader_terms, terms))
+
+def trigrams(token):
+    """Return the set of character trigrams in a token."""
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def deletes(token, max_distance=MAX_EDIT_DISTANCE):
+    """Return every string obtained by deleting up to max_distance characters."""
+    variants = {token}
+    for distance in range(1, min(max_distance, len(token) - 1) + 1):
+        for positions in combinations(range(len(token)), distance):
+            variants.add(''.join(c for i, c in enumerate(token) if i not in positions))
+    return variants
+
+def max_edits(term):
+    """Return the edit distance allowed for a query term."""
+    if len(term) < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if len(term) <= 5 else MAX_EDIT_DISTANCE
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b, or limit + 1 if larger."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+class RankedResult:
+    """Courses matching a query, ranked by (score, _id) key, highest first.
+
+    Most queries only show their first page, so it is picked with a top-k
+    selection; the full order is sorted once, when a cursor needs it.
+    """
+
+    def __init__(self, scores, order, used_fuzzy=False):
+        self.scores = scores  # course_id -> score including boost
+        self.used_fuzzy = used_fuzzy
+        self._order = order   # the index's course_id -> _id map
+        self._keys = None
+        self._course_ids = None
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _entries(self, course_ids):
+        order = self._order
+        return [(self.scores[cid], order[cid], cid) for cid in course_ids if cid in order]
+
+    def _sort(self):
+        if self._keys is None:
+            ranked = sorted(self._entries(self.scores))
+            self._keys = [(score, object_id) for score, object_id, _ in ranked]
+            self._course_ids = [cid for _, _, cid in ranked]
+
+    @property
+    def keys(self):
+        """Ranking keys in ascending order."""
+        self._sort()
+        return self._keys
+
+    @property
+    def course_ids(self):
+        """Course ids in ascending ranking order."""
+        self._sort()
+        return self._course_ids
+
+    def top(self, count):
+        """Return the (score, _id, course_id) entries of the count best courses, best first."""
+        if self._keys is not None or count >= len(self.scores):
+            self._sort()
+            start = max(len(self._keys) - count, 0)
+            return [key + (cid,) for key, cid in zip(self._keys[start:], self._course_ids[start:])][::-1]
+        scores = self.scores
+        # Select on the score alone (no tuple per match), then break ties on _id
+        best = heapq.nlargest(count, scores, key=scores.__getitem__)
+        if not best:
+            return []
+        cutoff = scores[best[-1]]
+        tied = [cid for cid in scores if scores[cid] == cutoff]
+        candidates = set(best).union(tied)
+        return sorted(self._entries(candidates), reverse=True)[:count]
+
+class CourseSearchIndex:
+    """In-memory token and trigram inverted index over course names."""
+
+    def __init__(self):
+        self.ready = False
+        self.courses = {}      # course_id -> course document
+        self._order = {}       # course_id -> ObjectId, newer courses rank first on ties
+        self._doc_tokens = {}  # course_id -> set of tokens in its name
+        self._postings = {}    # token -> set of course_ids
+        self._trigrams = {}    # trigram -> set of tokens
+        self._vocab = []       # sorted tokens, for prefix lookups
+        self._deletes = {}     # deletion variant -> set of tokens (SymSpell style)
+        self._boosts = {}      # course_id -> recency and popularity bonus
+        self._epoch = time.time()  # recency is measured back from when the index was built
+
+    def __len__(self):
+        return len(self.courses)
+
+    def clear(self):
+        """Drop everything from the index."""
+        self.__init__()
+
+    def add(self, course):
+        """Index a course document (replacing any previous version)."""
+        course_id = course.get('course_id')
+        if not course_id:
+            return
+        if course_id in self.courses:
+            self.remove(course_id)
+
+        self.courses[course_id] = dict(course)
+        self._order[course_id] = course.get('_id') or ObjectId()
+        self._set_boost(course_id)
+        tokens = set(tokenize(course.get('course_name', '')))
+        self._doc_tokens[course_id] = tokens
+        for token in tokens:
+            self._add_posting(token, course_id)
+
+    def remove(self, course_id):
+        """Remove a course from the index."""
+        if course_id not in self.courses:
+            return
+        for token in self._doc_tokens.pop(course_id, ()):
+            self._drop_posting(token, course_id)
+        del self.courses[course_id]
+        del self._order[course_id]
+        del self._boosts[course_id]
+
+    def update(self, course_id, fields):
+        """Apply a partial update to an indexed course."""
+        course = self.courses.get(course_id)
+        if course is None:
+            return
+        course = dict(course, **fields)
+        self.add(course)
+
+    def record_download(self, course_id, count=1):
+        """Bump a course's popularity after it has been delivered."""
+        course = self.courses.get(course_id)
+        if course is None:
+            return
+        course['download_count'] = course.get('download_count', 0) + count
+        self._set_boost(course_id)
+
+    def _set_boost(self, course_id):
+        """Compute a course's recency and popularity bonus from its own fields only.
+
+        Keyset cursors hold (score, _id), so a course's score may only change
+        when that course does.
+        """
+        course = self.courses[course_id]
+        boost = 0.0
+        added_on = course.get('added_on')
+        if added_on:
+            age = max(self._epoch - added_on.timestamp(), 0)
+            boost += RECENCY_WEIGHT * 0.5 ** (age / RECENCY_HALF_LIFE)
+        # Tiers only change when downloads double, so paging rarely sees a course move
+        tier = min(int(math.log2(1 + course.get('download_count', 0))), POPULARITY_TIERS)
+        boost += POPULARITY_WEIGHT * tier / POPULARITY_TIERS
+        self._boosts[course_id] = boost
+
+    def _add_posting(self, token, course_id):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = set()
+            bisect.insort(self._vocab, token)
+            for gram in trigrams(token):
+                self._trigrams.setdefault(gram, set()).add(token)
+            if len(token) >= MIN_FUZZY_LENGTH:
+                for variant in deletes(token):
+                    self._deletes.setdefault(variant, set()).add(token)
+        postings.add(course_id)
+
+    def _drop_posting(self, token, course_id):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.discard(course_id)
+        if postings:
+            return
+        del self._postings[token]
+        i = bisect.bisect_left(self._vocab, token)
+        if i < len(self._vocab) and self._vocab[i] == token:
+            del self._vocab[i]
+        for gram in trigrams(token):
+            tokens = self._trigrams.get(gram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._trigrams[gram]
+        if len(token) >= MIN_FUZZY_LENGTH:
+            for variant in deletes(token):
+                tokens = self._deletes.get(variant)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._deletes[variant]
+
+    def _fuzzy_tokens(self, term):
+        """Return {token: quality} for tokens within the allowed edit distance of a term."""
+        limit = max_edits(term)
+        if not limit:
+            return {}
+        candidates = set()
+        for variant in deletes(term, limit):
+            candidates.update(self._deletes.get(variant, ()))
+        matches = {}
+        for token in candidates:
+            distance = edit_distance(term, token, limit)
+            if 0 < distance <= limit:
+                matches[token] = FUZZY_SCORES[distance]
+        return matches
+
+    def _match_tokens(self, term, fuzzy=False):
+        """Return ({token: quality}, used_fuzzy) for vocabulary tokens matching a query term."""
+        matches = {}
+        # Exact and prefix matches from the sorted vocabulary
+        i = bisect.bisect_left(self._vocab, term)
+        while i < len(self._vocab) and self._vocab[i].startswith(term):
+            token = self._vocab[i]
+            matches[token] = EXACT_SCORE if token == term else PREFIX_SCORE
+            i += 1
+        # Infix matches through the trigram index
+        grams = trigrams(term)
+        if grams:
+            candidates = None
+            for gram in sorted(grams, key=lambda g: len(self._trigrams.get(g, ()))):
+                tokens = self._trigrams.get(gram)
+                if not tokens:
+                    candidates = set()
+                    break
+                candidates = set(tokens) if candidates is None else candidates & tokens
+                if not candidates:
+                    break
+            for token in candidates or ():
+                if token not in matches and term in token:
+                    matches[token] = SUBSTRING_SCORE
+        # Only fall back to typo tolerance when the term matched nothing as typed
+        if fuzzy and not matches:
+            return self._fuzzy_tokens(term), True
+        return matches, False
+
+    def _match_term(self, term, fuzzy=False):
+        """Return ({course_id: quality}, used_fuzzy) for courses matching a single query term."""
+        scores = {}
+        matches, used_fuzzy = self._match_tokens(term, fuzzy)
+        for token, quality in matches.items():
+            for course_id in self._postings[token]:
+                if scores.get(course_id, 0) < quality:
+                    scores[course_id] = quality
+        return scores, used_fuzzy
+
+    def match(self, query, fuzzy=False):
+        """Return ({course_id: score}, used_fuzzy) for every course matching all query terms."""
+        terms = tokenize(query)
+        if not terms:
+            return dict.fromkeys(self.courses, 0), False
+
+        result = None
+        any_fuzzy = False
+        for term in dict.fromkeys(terms):
+            scores, used_fuzzy = self._match_term(term, fuzzy)
+            any_fuzzy = any_fuzzy or used_fuzzy
+            if result is None:
+                result = scores
+            else:
+                result = {cid: score + scores[cid] for cid, score in result.items() if cid in scores}
+            if not result:
+                return {}, any_fuzzy
+        return result, any_fuzzy
+
+    def _score_course(self, course_id, terms):
+        """Strictly score one course against query terms, or None if a term doesn't match."""
+        tokens = self._doc_tokens[course_id]
+        total = 0
+        for term in terms:
+            best = 0
+            for token in tokens:
+                if token == term:
+                    best = EXACT_SCORE
+                    break
+                if token.startswith(term):
+                    best = PREFIX_SCORE
+                elif not best and len(term) >= 3 and term in token:
+                    best = SUBSTRING_SCORE
+            if not best:
+                return None
+            total += best
+        return total
+
+    def _rank_scores(self, scores, used_fuzzy):
+        boosts = self._boosts
+        return RankedResult({cid: score + boosts[cid] for cid, score in scores.items()}, self._order, used_fuzzy)
+
+    def rank(self, query, fuzzy=False):
+        """Rank every course matching a query."""
+        return self._rank_scores(*self.match(query, fuzzy))
+
+    def rank_within(self, query, broader):
+        """Rank a query using only the courses of a broader query's strict result.
+
+        Only valid when can_narrow() holds for the two queries; the result then
+        equals a strict full lookup.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores = {}
+        for cid in broader.scores:
+            if cid in self.courses:
+                score = self._score_course(cid, terms)
+                if score is not None:
+                    scores[cid] = score
+        return self._rank_scores(scores, False)
+
+    def page(self, ranked, max_results=10, offset=0, after=None):
+        """Return (course documents, total matches, key of the last result or None) for one page.
+
+        Results come highest ranked first. Passing the key returned by a previous
+        call as ``after`` continues from that point (keyset paging); ``offset``
+        skips ranked results instead.
+        """
+        if after is None:
+            # First pages don't need the full order
+            entries = ranked.top(offset + max_results + 1)
+            page = [cid for _, _, cid in entries[offset:offset + max_results]]
+            next_key = entries[offset + max_results - 1][:2] if len(entries) > offset + max_results else None
+        else:
+            end = bisect.bisect_left(ranked.keys, after)
+            end = max(end - offset, 0)
+            start = max(end - max_results, 0)
+            page = ranked.course_ids[start:end][::-1]
+            next_key = ranked.keys[start] if page and start > 0 else None
+        return [self.courses[cid] for cid in page if cid in self.courses], len(ranked), next_key
+
+    def search(self, query, max_results=10, offset=0, fuzzy=False, after=None):
+        """Return (ranked course documents, total matches, key of the last result or None)."""
+        return self.page(self.rank(query, fuzzy), max_results, offset, after)
+
+course_index = CourseSearchIndex()
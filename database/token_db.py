@@ -2,7 +2,6 @@ import logging
 import random
 import string
 from datetime import datetime
-from pymongo import MongoClient
 from pymongo.errors import DuplicateKeyError
 from info import DATABASE_URI, DATABASE_NAME, TOKEN_COLLECTION
 from .db_helpers import get_mongo_client
@@ -13,10 +12,6 @@ client = get_mongo_client(DATABASE_URI)
 db = client[DATABASE_NAME]
 tokens_col = db[TOKEN_COLLECTION]
 
-# Make sure we have proper indexes
-tokens_col.create_index("token", unique=True)
-tokens_col.create_index("user_id")
-
 async def generate_token(admin_id=None, max_uses=1, expiry_days=None):
     """Generate a new verification token."""
     # Generate a random 8-character alphanumeric token
@@ -41,7 +36,7 @@ async def generate_token(admin_id=None, max_uses=1, expiry_days=None):
     }
     
     try:
-        tokens_col.insert_one(token_doc)
+        await tokens_col.insert_one(token_doc)
         return True, token
     except DuplicateKeyError:
         # In the rare case of a duplicate token, try again
@@ -53,14 +48,14 @@ async def generate_token(admin_id=None, max_uses=1, expiry_days=None):
 async def verify_user_token(token, user_id):
     """Verify a token for a user and mark it as used."""
     # Find the token
-    token_doc = tokens_col.find_one({"token": token, "is_active": True})
+    token_doc = await tokens_col.find_one({"token": token, "is_active": True})
     
     if not token_doc:
         return False, "Invalid or inactive token."
     
     # Check if token has expired
     if token_doc.get("expiry") and datetime.now() > token_doc["expiry"]:
-        tokens_col.update_one({"token": token}, {"$set": {"is_active": False}})
+        await tokens_col.update_one({"token": token}, {"$set": {"is_active": False}})
         return False, "Token has expired."
     
     # Check if user has already used this token
@@ -69,11 +64,11 @@ async def verify_user_token(token, user_id):
     
     # Check if max uses reached
     if token_doc.get("max_uses") and token_doc.get("uses", 0) >= token_doc["max_uses"]:
-        tokens_col.update_one({"token": token}, {"$set": {"is_active": False}})
+        await tokens_col.update_one({"token": token}, {"$set": {"is_active": False}})
         return False, "Token has reached maximum usage limit."
     
     # Update token usage
-    result = tokens_col.update_one(
+    result = await tokens_col.update_one(
         {"token": token},
         {
             "$inc": {"uses": 1},
@@ -84,9 +79,9 @@ async def verify_user_token(token, user_id):
     
     if result.modified_count > 0:
         # Also mark user as verified in users collection
-        from database.users_chats_db import db as users_db
-        users_db.update_one(
-            {"id": user_id},
+        from database.users_chats_db import users_collection
+        await users_collection.update_one(
+            {"_id": user_id},
             {"$set": {"verified": True, "verified_on": datetime.now()}}
         )
         return True, "Token verified successfully."
@@ -95,15 +90,15 @@ async def verify_user_token(token, user_id):
 
 async def get_token_info(token):
     """Get information about a token."""
-    token_doc = tokens_col.find_one({"token": token})
+    token_doc = await tokens_col.find_one({"token": token})
     if not token_doc:
         return None
     return token_doc
 
 async def is_user_verified(user_id):
     """Check if a user is verified."""
-    from database.users_chats_db import db as users_db
-    user = users_db.find_one({"id": user_id})
+    from database.users_chats_db import users_collection
+    user = await users_collection.find_one({"_id": user_id})
     return user and user.get("verified", False)
 
 async def get_all_tokens(active_only=False, admin_id=None, limit=100):
@@ -114,20 +109,15 @@ async def get_all_tokens(active_only=False, admin_id=None, limit=100):
     if admin_id:
         query["created_by"] = admin_id
     
-    tokens = []
     cursor = tokens_col.find(query).sort("created_on", -1).limit(limit)
-    
-    for token in cursor:
-        tokens.append(token)
-    
-    return tokens
+    return await cursor.to_list(length=limit)
 
 async def delete_token(token):
     """Delete a token."""
-    result = tokens_col.delete_one({"token": token})
+    result = await tokens_col.delete_one({"token": token})
     return result.deleted_count > 0
 
 async def disable_token(token):
     """Disable a token without deleting it."""
-    result = tokens_col.update_one({"token": token}, {"$set": {"is_active": False}})
+    result = await tokens_col.update_one({"token": token}, {"$set": {"is_active": False}})
     return result.modified_count > 0 
\ No newline at end of file
@@ -30,7 +30,7 @@ async def create_token(user_id, days_valid=30, usage_limit=1):
             "active": True
         }
         
-        tokens_col.insert_one(token_doc)
+        await tokens_col.insert_one(token_doc)
         return token, None
     except Exception as e:
         logger.error(f"Error creating token: {e}")
@@ -42,7 +42,7 @@ async def verify_token(token):
         return True, None
         
     try:
-        token_doc = tokens_col.find_one({"token": token})
+        token_doc = await tokens_col.find_one({"token": token})
         
         if not token_doc:
             return False, "Invalid token"
@@ -63,7 +63,7 @@ async def verify_token(token):
             return False, "Token usage limit reached"
             
         # Update usage count
-        tokens_col.update_one(
+        await tokens_col.update_one(
             {"token": token},
             {"$inc": {"usage_count": 1}}
         )
@@ -79,7 +79,7 @@ async def get_token_info(token):
         return None
         
     try:
-        return tokens_col.find_one({"token": token})
+        return await tokens_col.find_one({"token": token})
     except Exception as e:
         logger.error(f"Error getting token info: {e}")
         return None
@@ -90,7 +90,7 @@ async def deactivate_token(token):
         return False
         
     try:
-        result = tokens_col.update_one(
+        result = await tokens_col.update_one(
             {"token": token},
             {"$set": {"active": False}}
         )
@@ -105,13 +105,8 @@ async def list_user_tokens(user_id):
         return []
         
     try:
-        tokens = []
         cursor = tokens_col.find({"created_by": user_id})
-        
-        for token in cursor:
-            tokens.append(token)
-            
-        return tokens
+        return await cursor.to_list(length=None)
     except Exception as e:
         logger.error(f"Error listing user tokens: {e}")
         return [] 
\ No newline at end of file
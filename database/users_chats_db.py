@@ -1,17 +1,35 @@
 import datetime
+from pymongo import UpdateOne, ReturnDocument
 from pymongo.errors import DuplicateKeyError
-from info import DATABASE_URI, DATABASE_NAME
+from info import DATABASE_URI, DATABASE_NAME, STATS_CACHE_TTL
 from .db_helpers import get_mongo_client
+from .cache import LRUCache
+from .membership import membership
 
 client = get_mongo_client(DATABASE_URI)
 db = client[DATABASE_NAME]
 users_collection = db.users
 chats_collection = db.chats
 
+# Recently resolved usernames (lowercase, without @) -> user id
+USERNAME_CACHE_SIZE = 1000
+# User id -> username stored for a user known to be reachable, so /start can skip the write
+SAVED_USERNAME_CACHE_SIZE = 100000
+
+def normalize_username(username):
+    """Return a username lowercased and without a leading @, or None."""
+    if not username:
+        return None
+    return username.lstrip("@").lower() or None
+
 class Database:
     def __init__(self):
-        self.user_count = users_collection.count_documents({})
-        self.chat_count = chats_collection.count_documents({})
+        # Counts are loaded lazily on first use since Motor can't be awaited here
+        self.user_count = None
+        self.chat_count = None
+        self.username_cache = LRUCache(max_size=USERNAME_CACHE_SIZE)
+        self.saved_usernames = LRUCache(max_size=SAVED_USERNAME_CACHE_SIZE)
+        self.stats_cache = LRUCache(max_size=16, ttl=STATS_CACHE_TTL)
 
     async def add_user(self, user_id, username=None):
         """Add a new user or update user info."""
@@ -19,16 +37,22 @@ class Database:
             user = {
                 "_id": user_id,
                 "username": username,
-                "join_date": datetime.datetime.now()
+                "username_lower": normalize_username(username),
+                "join_date": datetime.datetime.now(),
+                # A returning user can be messaged again
+                "reachable": True
             }
             
-            users_collection.update_one(
+            previous = await users_collection.find_one_and_update(
                 {"_id": user_id},
                 {"$set": user},
-                upsert=True
+                projection={"username_lower": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
             )
-            if users_collection.count_documents({"_id": user_id}) == 1:
+            if previous is None and self.user_count is not None:
                 self.user_count += 1
+            await self._claim_username(user_id, user["username_lower"], previous)
             
             return True
         except Exception as e:
@@ -38,7 +62,7 @@ class Database:
     async def get_user(self, user_id):
         """Get a user from the database."""
         try:
-            return users_collection.find_one({"_id": user_id})
+            return await users_collection.find_one({"_id": user_id})
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
@@ -46,8 +70,10 @@ class Database:
     async def remove_user(self, user_id):
         """Remove a user from the database."""
         try:
-            users_collection.delete_one({"_id": user_id})
-            self.user_count -= 1
+            result = await users_collection.delete_one({"_id": user_id})
+            if result.deleted_count and self.user_count is not None:
+                self.user_count -= 1
+            self._forget_username(user_id)
             return True
         except Exception as e:
             print(f"Error removing user: {e}")
@@ -62,12 +88,12 @@ class Database:
                 "join_date": datetime.datetime.now()
             }
             
-            chats_collection.update_one(
+            result = await chats_collection.update_one(
                 {"_id": chat_id},
                 {"$set": chat},
                 upsert=True
             )
-            if chats_collection.count_documents({"_id": chat_id}) == 1:
+            if result.upserted_id is not None and self.chat_count is not None:
                 self.chat_count += 1
             
             return True
@@ -78,8 +104,9 @@ class Database:
     async def remove_chat(self, chat_id):
         """Remove a chat from the database."""
         try:
-            chats_collection.delete_one({"_id": chat_id})
-            self.chat_count -= 1
+            result = await chats_collection.delete_one({"_id": chat_id})
+            if result.deleted_count and self.chat_count is not None:
+                self.chat_count -= 1
             return True
         except Exception as e:
             print(f"Error removing chat: {e}")
@@ -89,59 +116,160 @@ class Database:
         """Retrieve all user records from the database."""
         return users_collection.find({})
 
+    async def get_user_id_batch(self, after=None, limit=100):
+        """Return up to limit reachable user ids greater than after, in ascending order."""
+        # An equality match, so the (reachable, _id) index bounds the scan and gives the order
+        query = {"reachable": True}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        cursor = users_collection.find(query, {"_id": 1}).sort("_id", 1).limit(limit)
+        return [user["_id"] async for user in cursor]
+
+    async def get_reachable_user_count(self):
+        """Get the number of users a broadcast will try to reach."""
+        return await users_collection.count_documents({"reachable": True})
+
+    async def mark_unreachable(self, failures):
+        """Flag users who blocked the bot or deleted their account, given {user_id: reason}."""
+        if not failures:
+            return 0
+        now = datetime.datetime.now()
+        requests = [
+            UpdateOne({"_id": user_id}, {"$set": {"reachable": False, "unreachable_reason": reason, "unreachable_at": now}})
+            for user_id, reason in failures.items()
+        ]
+        result = await users_collection.bulk_write(requests, ordered=False)
+        for user_id in failures:
+            # Their next /start has to write reachable back
+            self.saved_usernames.pop(user_id)
+        return result.modified_count
+
+    async def refresh_user(self, user_id, username=None):
+        """Update a returning user's username and mark them reachable again.
+
+        Skips the write when the stored username is already current.
+        """
+        key = normalize_username(username)
+        if user_id in self.saved_usernames and self.saved_usernames.get(user_id, count=False) == key:
+            return
+        previous = await users_collection.find_one_and_update(
+            {"_id": user_id},
+            {"$set": {"username": username, "username_lower": key, "reachable": True}},
+            projection={"username_lower": 1}
+        )
+        if previous is not None:
+            await self._claim_username(user_id, key, previous)
+
+    async def _claim_username(self, user_id, key, previous):
+        """Point a username at user_id only, given the user's document before the write."""
+        old_key = previous.get("username_lower") if previous else None
+        if old_key and old_key != key and self.username_cache.get(old_key, count=False) == user_id:
+            self.username_cache.pop(old_key)
+        if key:
+            # Usernames are unique on Telegram, so anyone else still holding this one has given it up
+            await users_collection.update_many(
+                {"username_lower": key, "_id": {"$ne": user_id}},
+                {"$set": {"username": None, "username_lower": None}}
+            )
+            self.username_cache.set(key, user_id)
+        self.saved_usernames.set(user_id, key)
+
+    def _forget_username(self, user_id):
+        key = self.saved_usernames.pop(user_id)
+        if key and self.username_cache.get(key, count=False) == user_id:
+            self.username_cache.pop(key)
+
+    async def get_user_id_by_username(self, username):
+        """Resolve a username (with or without @, any case) to a user id, or None."""
+        key = normalize_username(username)
+        if not key:
+            return None
+        user_id = self.username_cache.get(key)
+        if user_id is not None:
+            return user_id
+        user = await users_collection.find_one({"username_lower": key}, {"_id": 1})
+        if not user:
+            return None
+        self.username_cache.set(key, user["_id"])
+        return user["_id"]
+
+    async def backfill_reachable(self):
+        """Mark users saved before the reachable flag existed as reachable. Returns the number updated."""
+        result = await users_collection.update_many(
+            {"reachable": {"$exists": False}},
+            {"$set": {"reachable": True}}
+        )
+        return result.modified_count
+
+    async def backfill_usernames(self):
+        """Fill username_lower for users saved before it existed. Returns the number updated."""
+        result = await users_collection.update_many(
+            {"username": {"$type": "string"}, "username_lower": {"$exists": False}},
+            [{"$set": {"username_lower": {"$toLower": "$username"}}}]
+        )
+        return result.modified_count
+
     async def get_all_chats(self):
         """Retrieve all chat records from the database."""
         return chats_collection.find({})
 
     async def get_user_count(self):
         """Get the number of users in the database."""
+        if self.user_count is None:
+            self.user_count = await users_collection.count_documents({})
         return self.user_count
 
     async def get_chat_count(self):
         """Get the number of chats in the database."""
+        if self.chat_count is None:
+            self.chat_count = await chats_collection.count_documents({})
         return self.chat_count
 
     async def get_db_size(self):
         """Get the total size of the database."""
-        return db.command("dbstats")["dataSize"]
+        return (await db.command("dbstats"))["dataSize"]
 
     async def get_bot_stats(self):
         """Get overall bot statistics."""
         return {
-            "users_count": self.user_count,
-            "chats_count": self.chat_count,
+            "users_count": await self.get_user_count(),
+            "chats_count": await self.get_chat_count(),
             "db_size": await self.get_db_size()
         }
 
     async def get_banned(self):
         """Get banned users and chats."""
-        banned_users = list(users_collection.find({"ban_status.is_banned": True}))
-        banned_chats = list(chats_collection.find({"ban_status.is_banned": True}))
+        banned_users = await users_collection.find({"ban_status.is_banned": True}, {"_id": 1}).to_list(length=None)
+        banned_chats = await chats_collection.find({"ban_status.is_banned": True}, {"_id": 1}).to_list(length=None)
         return banned_users, banned_chats
 
     async def ban_user(self, user_id, ban_reason="No reason"):
         """Ban a user."""
         ban_status = {"is_banned": True, "ban_reason": ban_reason}
-        users_collection.update_one({"_id": user_id}, {"$set": {"ban_status": ban_status}})
+        await users_collection.update_one({"_id": user_id}, {"$set": {"ban_status": ban_status}})
+        membership.set_banned_user(user_id, True)
 
     async def unban_user(self, user_id):
         """Unban a user."""
         ban_status = {"is_banned": False, "ban_reason": ""}
-        users_collection.update_one({"_id": user_id}, {"$set": {"ban_status": ban_status}})
+        await users_collection.update_one({"_id": user_id}, {"$set": {"ban_status": ban_status}})
+        membership.set_banned_user(user_id, False)
 
     async def ban_chat(self, chat_id, ban_reason="No reason"):
         """Ban a chat."""
         ban_status = {"is_banned": True, "ban_reason": ban_reason}
-        chats_collection.update_one({"_id": chat_id}, {"$set": {"ban_status": ban_status}})
+        await chats_collection.update_one({"_id": chat_id}, {"$set": {"ban_status": ban_status}})
+        membership.set_banned_chat(chat_id, True)
 
     async def unban_chat(self, chat_id):
         """Unban a chat."""
         ban_status = {"is_banned": False, "ban_reason": ""}
-        chats_collection.update_one({"_id": chat_id}, {"$set": {"ban_status": ban_status}})
+        await chats_collection.update_one({"_id": chat_id}, {"$set": {"ban_status": ban_status}})
+        membership.set_banned_chat(chat_id, False)
         
     async def is_user_exist(self, user_id):
         """Check if a user exists in the database."""
-        return users_collection.count_documents({"_id": user_id}) > 0
+        return await users_collection.count_documents({"_id": user_id}, limit=1) > 0
         
     async def set_premium_status(self, user_id, status=True, expiry_date=None):
         """Set a user's premium status."""
@@ -155,10 +283,13 @@ class Database:
             "premium_expiry": expiry_date if status else None
         }
         
-        result = users_collection.update_one(
+        result = await users_collection.update_one(
             {"_id": user_id},
             {"$set": premium_data}
         )
+        if result.matched_count:
+            membership.set_premium(user_id, status)
+            self.stats_cache.pop("premium_count")
         
         return result.modified_count > 0
         
@@ -169,7 +300,7 @@ class Database:
             "verified_at": datetime.datetime.now() if verified else None
         }
         
-        result = users_collection.update_one(
+        result = await users_collection.update_one(
             {"_id": user_id},
             {"$set": verification_data}
         )
@@ -193,29 +324,40 @@ class Database:
             "referred_at": datetime.datetime.now()
         }
         
-        result = users_collection.update_one(
+        result = await users_collection.update_one(
             {"_id": user_id},
             {"$set": referral_data}
         )
         
         # Update referrer's stats
         if result.modified_count > 0:
-            users_collection.update_one(
+            await users_collection.update_one(
                 {"_id": referred_by},
                 {"$inc": {"referral_count": 1}}
             )
             
         return result.modified_count > 0
         
+    async def get_premium_count(self):
+        """Count active premium users server-side (cached for STATS_CACHE_TTL seconds)."""
+        count = self.stats_cache.get("premium_count")
+        if count is None:
+            count = await users_collection.count_documents({
+                "is_premium": True,
+                "premium_expiry": {"$gt": datetime.datetime.now()}
+            })
+            self.stats_cache.set("premium_count", count)
+        return count
+
     async def get_premium_users(self):
         """Get all premium users."""
         current_time = datetime.datetime.now()
         
         # Find users where is_premium is true and premium_expiry is in the future
-        premium_users = list(users_collection.find({
+        premium_users = await users_collection.find({
             "is_premium": True,
             "premium_expiry": {"$gt": current_time}
-        }))
+        }).to_list(length=None)
         
         return premium_users
         
@@ -224,21 +366,30 @@ class Database:
         current_time = datetime.datetime.now()
         
         # Find users where is_premium is true but premium_expiry is in the past
-        expired_users = list(users_collection.find({
+        expired_users = await users_collection.find({
             "is_premium": True,
             "premium_expiry": {"$lt": current_time}
-        }))
+        }).to_list(length=None)
         
         return expired_users
         
-    async def process_expired_premiums(self):
-        """Process expired premium subscriptions."""
-        expired_users = await self.get_expired_premium_users()
-        
-        for user in expired_users:
-            # Set premium status to false
-            await self.set_premium_status(user["_id"], False)
-            
-        return len(expired_users)
+    async def get_premium_expiries(self, until):
+        """Return (user_id, expiry) for premium users expiring before until, soonest first."""
+        cursor = users_collection.find(
+            {"is_premium": True, "premium_expiry": {"$lte": until}},
+            {"premium_expiry": 1}
+        ).sort("premium_expiry", 1)
+        return [(user["_id"], user["premium_expiry"]) async for user in cursor]
+
+    async def expire_premium_users(self, user_ids, now=None):
+        """Revoke premium for the given users whose expiry has passed, in one update."""
+        now = now or datetime.datetime.now()
+        result = await users_collection.update_many(
+            {"_id": {"$in": list(user_ids)}, "is_premium": True, "premium_expiry": {"$lte": now}},
+            {"$set": {"is_premium": False, "premium_since": None, "premium_expiry": None}}
+        )
+        membership.expire_premium(user_ids)
+        self.stats_cache.pop("premium_count")
+        return result.modified_count
 
 db = Database() 
\ No newline at end of file
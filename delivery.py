@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pyrogram.errors import FloodWait
+from database.courses_db import get_course_snapshot, record_course_download
+from database.delivery_db import (
+    enqueue_delivery, claim_next_job, checkpoint_job, finish_job, defer_job,
+    requeue_interrupted_jobs, stamp_finished_jobs, get_queue_stats, DONE, FAILED
+)
+from info import DELIVERY_WORKERS, PUBLIC_CHANNEL
+from utils import send_all_files
+from inflight import inflight, RUNNING
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# How often idle workers look for jobs enqueued by another process
+POLL_INTERVAL = 30
+
+# Seconds a job waits before retrying when its user already has DELIVERY_USER_LIMIT courses sending
+DEFER_DELAY = 5
+
+class DeliveryQueue:
+    """Drains persisted course delivery jobs with a fixed pool of workers."""
+
+    def __init__(self, workers=DELIVERY_WORKERS):
+        self.workers = workers
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self._bot = None
+
+    async def start(self, bot):
+        """Resume interrupted jobs and start the workers."""
+        if self._tasks:
+            return
+        self._bot = bot
+        resumed = await requeue_interrupted_jobs()
+        if resumed:
+            logger.info(f"Resuming {resumed} interrupted course deliveries")
+        try:
+            await stamp_finished_jobs()
+        except Exception as e:
+            logger.error(f"Error stamping finished delivery jobs: {e}")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._wakeup.set()
+
+    async def stop(self):
+        """Cancel the workers; their running jobs are resumed on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, user_id, chat_id, course_id):
+        """Queue a course for delivery and wake the workers.
+
+        The delivery is registered with the in-flight registry right away, so
+        repeat requests coalesce onto it while it waits.
+        """
+        delivery = inflight.queue(user_id, course_id)
+        try:
+            job_id = await enqueue_delivery(user_id, chat_id, course_id)
+        except Exception:
+            inflight.finish(delivery)
+            raise
+        self._wakeup.set()
+        return job_id
+
+    async def stats(self):
+        return await get_queue_stats()
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await claim_next_job()
+            except Exception as e:
+                logger.error(f"Error claiming delivery job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Delivery job {job['_id']} failed: {e}")
+                await finish_job(job['_id'], FAILED, str(e))
+
+    async def _run(self, job):
+        """Deliver a job and finish it, unless it was put back in the queue to wait."""
+        user_id = job['user_id']
+        course_id = job['course_id']
+        chat_id = job['chat_id']
+
+        # Jobs queued before a restart aren't registered yet
+        delivery = inflight.get(user_id, course_id)
+        if delivery is not None and delivery.sending:
+            # A Download All tap is already sending this course
+            inflight.coalesce(RUNNING, delivery)
+            logger.info(f"Skipping delivery job {job['_id']}: course {course_id} is already being sent to {user_id}")
+            await finish_job(job['_id'], DONE)
+            return
+        delivery = delivery or inflight.queue(user_id, course_id)
+
+        deferred = False
+        try:
+            snapshot = await get_course_snapshot(course_id)
+            if not snapshot or not snapshot.files:
+                raise ValueError(f"Course {course_id} has no files to deliver")
+            course, files = snapshot.course, snapshot.files
+
+            if not inflight.begin(delivery, len(files)):
+                await defer_job(job['_id'], DEFER_DELAY)
+                deferred = True
+                asyncio.get_running_loop().call_later(DEFER_DELAY, self._wakeup.set)
+                return
+
+            sent = job.get('sent', 0)
+            failed = job.get('failed', 0)
+            delivery.sent, delivery.failed = sent, failed
+
+            async def checkpoint(cursor, batch_sent, batch_failed):
+                delivery.sent, delivery.failed = sent + batch_sent, failed + batch_failed
+                await checkpoint_job(job['_id'], cursor, delivery.sent, delivery.failed)
+
+            try:
+                await send_all_files(self._bot, chat_id, course_id, files, start=job.get('cursor', 0), checkpoint=checkpoint)
+            except FloodWait as e:
+                # Progress up to the first unsent file is checkpointed; pick up
+                # from there once Telegram lets us send again
+                await defer_job(job['_id'], e.value)
+                inflight.requeue(delivery)
+                deferred = True
+                asyncio.get_running_loop().call_later(e.value, self._wakeup.set)
+                return
+        finally:
+            if not deferred:
+                inflight.finish(delivery)
+
+        # Send a message after all files are sent
+        complete_text = f"<b>✅ All files for {course['course_name']} have been sent!</b>\n\nI hope you find it valuable. Happy learning!\n\nReady for more? You can always browse other courses or check out our updates channel."
+        buttons = [[
+            InlineKeyboardButton('🔍 Browse More Courses', switch_inline_query_current_chat=''),
+            InlineKeyboardButton('📢 Updates Channel', url=f"https://t.me/{PUBLIC_CHANNEL}")
+        ]]
+        try:
+            await self._bot.send_message(chat_id, complete_text, reply_markup=InlineKeyboardMarkup(buttons))
+        except Exception as e:
+            # Every file was delivered, so the job still counts as done
+            logger.error(f"Error sending completion message for delivery job {job['_id']}: {e}")
+
+        # Counted once per job however many segments it was sent in; finish_job
+        # only succeeds for a running job, so a job can't be counted twice
+        if await finish_job(job['_id'], DONE) and delivery.sent:
+            await record_course_download(course_id)
+
+delivery_queue = DeliveryQueue()
@@ -0,0 +1,127 @@
+import time
+from database.cache import LRUCache
+from info import DELIVERY_USER_LIMIT, DELIVERY_COOLDOWN
+
+# Reasons a delivery can't start
+RUNNING = "running"    # the same course is already queued or being sent to this user
+COOLDOWN = "cooldown"  # the same course was sent to this user moments ago
+BUSY = "busy"          # the user already has DELIVERY_USER_LIMIT deliveries sending
+
+MAX_RECENT = 10000
+
+class Delivery:
+    """Progress of one course being sent to one user."""
+
+    def __init__(self, user_id, course_id, total=0, sending=True):
+        self.user_id = user_id
+        self.course_id = course_id
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        # False while the delivery waits in the delivery queue
+        self.sending = sending
+        self.started = time.monotonic()
+
+    @property
+    def key(self):
+        return (self.user_id, self.course_id)
+
+class InflightRegistry:
+    """Tracks queued and running course deliveries, keyed by (user, course).
+
+    Repeat requests for a delivery that is queued, running, or finished
+    within the cooldown are turned away with its progress instead of
+    starting a second send loop. Only sending deliveries count towards the
+    per-user limit. None of the methods await, so check() followed by
+    start() or queue() can't race another request.
+    """
+
+    def __init__(self, user_limit=DELIVERY_USER_LIMIT, cooldown=DELIVERY_COOLDOWN):
+        self.user_limit = user_limit
+        self._active = {}  # (user_id, course_id) -> Delivery
+        self._sending = {}  # user_id -> number of deliveries sending
+        self._recent = LRUCache(max_size=MAX_RECENT, ttl=cooldown) if cooldown else None
+        self.coalesced = 0
+
+    def check(self, user_id, course_id):
+        """Return (reason, delivery) if a new delivery can't start now, else (None, None)."""
+        delivery = self._active.get((user_id, course_id))
+        if delivery:
+            return RUNNING, delivery
+        if self._recent is not None:
+            delivery = self._recent.get((user_id, course_id), count=False)
+            if delivery:
+                return COOLDOWN, delivery
+        if self._sending.get(user_id, 0) >= self.user_limit:
+            return BUSY, None
+        return None, None
+
+    def coalesce(self, reason, delivery=None):
+        """Count a request turned away by check() and return the text to answer it with."""
+        if reason in (RUNNING, COOLDOWN):
+            self.coalesced += 1
+        return self.describe(reason, delivery)
+
+    def start(self, user_id, course_id, total=0):
+        """Register a delivery that starts sending now; call right after check() allowed it."""
+        delivery = Delivery(user_id, course_id, total)
+        self._active[delivery.key] = delivery
+        self._sending[user_id] = self._sending.get(user_id, 0) + 1
+        return delivery
+
+    def queue(self, user_id, course_id):
+        """Register a delivery waiting in the delivery queue, or return the one already registered."""
+        delivery = self._active.get((user_id, course_id))
+        if delivery is None:
+            delivery = Delivery(user_id, course_id, sending=False)
+            self._active[delivery.key] = delivery
+        return delivery
+
+    def begin(self, delivery, total):
+        """Move a queued delivery to sending. Returns False if the user is at the limit."""
+        if delivery.sending:
+            return True
+        if self._sending.get(delivery.user_id, 0) >= self.user_limit:
+            return False
+        delivery.sending = True
+        delivery.total = total
+        self._sending[delivery.user_id] = self._sending.get(delivery.user_id, 0) + 1
+        return True
+
+    def requeue(self, delivery):
+        """Move a sending delivery back to waiting in the queue."""
+        if delivery.sending:
+            delivery.sending = False
+            self._release(delivery.user_id)
+
+    def _release(self, user_id):
+        count = self._sending.pop(user_id, 0) - 1
+        if count > 0:
+            self._sending[user_id] = count
+
+    def finish(self, delivery):
+        if self._active.get(delivery.key) is not delivery:
+            return
+        del self._active[delivery.key]
+        if delivery.sending:
+            self._release(delivery.user_id)
+        if self._recent is not None and delivery.sent:
+            self._recent.set(delivery.key, delivery)
+
+    def get(self, user_id, course_id):
+        return self._active.get((user_id, course_id))
+
+    def describe(self, reason, delivery=None):
+        """Short text telling the user why their request was not started."""
+        if reason == RUNNING:
+            if delivery.total:
+                return f"Already sending this course: {delivery.sent}/{delivery.total} files sent."
+            return "This course is already on its way."
+        if reason == COOLDOWN:
+            return f"This course was just sent ({delivery.sent} files). Please check your chat."
+        return f"You already have {self.user_limit} courses being sent. Please wait for them to finish."
+
+    def stats(self):
+        return {"active": len(self._active), "coalesced": self.coalesced}
+
+inflight = InflightRegistry()
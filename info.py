@@ -38,6 +38,13 @@ DATABASE_NAME = environ.get('DATABASE_NAME', "chess_courses_bot")
 COURSES_COLLECTION = environ.get('COURSES_COLLECTION', 'courses')
 FILES_COLLECTION = environ.get('FILES_COLLECTION', 'course_files')
 
+# MongoDB connection pool settings (shared by every database module)
+MONGO_MAX_POOL_SIZE = int(environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(environ.get('MONGO_MAX_IDLE_TIME_MS', '0')) # 0 = keep idle connections forever
+MONGO_COMPRESSORS = environ.get('MONGO_COMPRESSORS', '') # e.g. "zstd,snappy,zlib"
+MONGO_READ_PREFERENCE = environ.get('MONGO_READ_PREFERENCE', 'primary')
+
 # Multiple database support
 MULTI_DB_ENABLED = environ.get('MULTI_DB_ENABLED', 'False').lower() == 'true'
 FALLBACK_DATABASE_URI = environ.get('FALLBACK_DATABASE_URI', '')
@@ -48,6 +55,41 @@ SHORTENER_API = environ.get('SHORTENER_API', '')
 SHORTENER_DOMAIN = environ.get('SHORTENER_DOMAIN', '')
 SHORTENER_API_KEY = environ.get('SHORTENER_API_KEY', '')
 
+# Inline search: max number of prebuilt inline results kept in memory
+INLINE_CACHE_SIZE = int(environ.get('INLINE_CACHE_SIZE', '2000'))
+
+# Search result cache (number of distinct queries, seconds to keep them)
+SEARCH_CACHE_SIZE = int(environ.get('SEARCH_CACHE_SIZE', '1000'))
+SEARCH_CACHE_TTL = int(environ.get('SEARCH_CACHE_TTL', '300'))
+
+# Course snapshot cache (total file entries kept in memory, most popular courses loaded at startup)
+COURSE_CACHE_FILES = int(environ.get('COURSE_CACHE_FILES', '20000'))
+COURSE_CACHE_WARM = int(environ.get('COURSE_CACHE_WARM', '50'))
+
+# Seconds to reuse computed /stats figures that aren't kept as live counters
+STATS_CACHE_TTL = int(environ.get('STATS_CACHE_TTL', '60'))
+
+# Outgoing message limits (Telegram allows about 30/s overall, 1/s per chat, 20/min per group)
+SEND_GLOBAL_RATE = float(environ.get('SEND_GLOBAL_RATE', '30'))
+SEND_CHAT_RATE = float(environ.get('SEND_CHAT_RATE', '1'))
+SEND_GROUP_RATE = float(environ.get('SEND_GROUP_RATE', '20')) # per minute
+
+# Course delivery queue
+DELIVERY_COLLECTION = environ.get('DELIVERY_COLLECTION', 'delivery_jobs')
+DELIVERY_WORKERS = int(environ.get('DELIVERY_WORKERS', '4'))
+DELIVERY_USER_LIMIT = int(environ.get('DELIVERY_USER_LIMIT', '2')) # Courses sent to one user at the same time
+DELIVERY_COOLDOWN = int(environ.get('DELIVERY_COOLDOWN', '30')) # Seconds a finished course can't be re-requested
+DELIVERY_JOB_RETENTION = int(environ.get('DELIVERY_JOB_RETENTION', '7')) # Days finished jobs are kept before MongoDB deletes them
+
+# Retries for failed Telegram calls
+RETRY_MAX_ATTEMPTS = int(environ.get('RETRY_MAX_ATTEMPTS', '5'))
+RETRY_MAX_WAIT = int(environ.get('RETRY_MAX_WAIT', '300')) # longest FloodWait worth waiting out, in seconds
+
+# Broadcasts
+BROADCAST_COLLECTION = environ.get('BROADCAST_COLLECTION', 'broadcasts')
+BROADCAST_CONCURRENCY = int(environ.get('BROADCAST_CONCURRENCY', '20'))
+BROADCAST_BATCH_SIZE = int(environ.get('BROADCAST_BATCH_SIZE', '100')) # users per checkpoint
+
 # Token Verification
 TOKEN_VERIFICATION_ENABLED = environ.get('TOKEN_VERIFICATION_ENABLED', 'False').lower() == 'true'
 TOKEN_COLLECTION = environ.get('TOKEN_COLLECTION', 'verification_tokens')
@@ -63,6 +105,7 @@ TUTORIAL_BUTTON_URL = environ.get('TUTORIAL_BUTTON_URL', '')
 # Bot settings
 AUTO_DELETE = environ.get('AUTO_DELETE_ENABLED', 'True').lower() == 'true'
 PROTECT_CONTENT = environ.get('PROTECT_CONTENT', 'False').lower() == 'true'
+MEDIA_GROUP_DELIVERY = environ.get('MEDIA_GROUP_DELIVERY', 'True').lower() == 'true' # Send course files as albums of up to 10
 PORT = environ.get("PORT", "8080")
 CUSTOM_FILE_CAPTION = environ.get("CUSTOM_FILE_CAPTION", "{file_name}")
 
@@ -0,0 +1,30 @@
+import logging
+from pyrogram import Client, filters
+from database.membership import membership
+
+logger = logging.getLogger(__name__)
+
+async def is_banned_update(_, __, update):
+    """Match updates from a banned user or in a banned chat. Admins are never matched."""
+    user = getattr(update, "from_user", None)
+    if user:
+        if user.id in membership.admins:
+            return False
+        if user.id in membership.banned_users:
+            return True
+    chat = getattr(update, "chat", None)
+    if chat is None and getattr(update, "message", None):
+        # Callback queries carry the chat on their message
+        chat = update.message.chat
+    return bool(chat and chat.id in membership.banned_chats)
+
+banned = filters.create(is_banned_update)
+
+# Group -1 runs before the regular handlers in group 0
+@Client.on_message(banned, group=-1)
+@Client.on_callback_query(banned, group=-1)
+@Client.on_inline_query(banned, group=-1)
+async def drop_banned_update(client, update):
+    """Stop updates from banned users and chats before any other handler sees them."""
+    membership.dropped_updates += 1
+    update.stop_propagation()
@@ -7,6 +7,7 @@ import aiofiles.os
 import re
 import uuid
 import pytz
+from bson import ObjectId
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, ForceReply, Message, CallbackQuery
 from pyrogram.errors import ChatAdminRequired, FloodWait, UserIsBlocked, InputUserDeactivated, MessageNotModified
@@ -16,12 +17,15 @@ from database.users_chats_db import db
 from database.courses_db import (
     save_course, 
     save_course_file, 
-    get_course_by_id, 
-    get_course_files, 
+    get_course_snapshot, 
     search_courses, 
-    get_all_courses
+    get_catalog_stats
 )
-from utils import temp, get_size, extract_user_id, extract_course_id, send_all_files, check_premium_user, check_token_required, get_shortlink
+from delivery import delivery_queue
+from inflight import inflight, RUNNING, COOLDOWN
+from broadcast import broadcaster, format_progress, broadcast_buttons
+from database.broadcast_db import create_broadcast, get_broadcast
+from utils import temp, get_size, extract_user_id, extract_course_id, check_premium_user, check_token_required, get_shortlink, get_deep_link, get_bot_username
 from Script import script
 
 logger = logging.getLogger(__name__)
@@ -32,7 +36,7 @@ async def start(client, message):
     if message.chat.type in ['group', 'supergroup']:
         # If command is used in a group
         buttons = [[
-            InlineKeyboardButton('🚀 Start a Chat with Me', url=f'https://t.me/{temp.U_NAME}?start=group_start'),
+            InlineKeyboardButton('🚀 Start a Chat with Me', url=get_deep_link('group_start')),
             InlineKeyboardButton('🔍 Search Courses Here', switch_inline_query_current_chat='')
         ],[
             InlineKeyboardButton('💬 Support', url=f'https://t.me/{SUPPORT_CHAT_ID}'),
@@ -48,12 +52,16 @@ async def start(client, message):
 
     # Add user to database if not exists
     if not await db.is_user_exist(message.from_user.id):
-        await db.add_user(message.from_user.id, message.from_user.first_name)
+        await db.add_user(message.from_user.id, message.from_user.username)
         # Add timestamp to log message
         tz = pytz.timezone('Asia/Kolkata')
         now = datetime.datetime.now(tz)
         time_str = now.strftime("%Y-%m-%d %H:%M:%S %Z")
         await client.send_message(LOG_CHANNEL, script.LOG_TEXT_P.format(message.from_user.id, message.from_user.mention, time_str))
+    else:
+        # Keeps the username lookup current, and users skipped by broadcasts
+        # after blocking the bot become reachable again
+        await db.refresh_user(message.from_user.id, message.from_user.username)
 
     # Command used in private chat
     if len(message.command) > 1:
@@ -63,11 +71,20 @@ async def start(client, message):
         if param.startswith('course_'):
             # Handle course download links
             course_id = param.split('_')[1]
-            course = await get_course_by_id(course_id)
             
-            if not course:
+            # Reopening the link while the course is queued or being sent just shows
+            # its progress. A user at the concurrency limit still gets queued.
+            reason, active = inflight.check(message.from_user.id, course_id)
+            if reason in (RUNNING, COOLDOWN):
+                await message.reply_text(inflight.coalesce(reason, active))
+                return
+            
+            snapshot = await get_course_snapshot(course_id)
+            
+            if not snapshot:
                 await message.reply_text(script.COURSE_NOT_FOUND)
                 return
+            course = snapshot.course
             
             # Check token verification
             if TOKEN_VERIFICATION_ENABLED:
@@ -108,9 +125,7 @@ async def start(client, message):
                     )
                     return
                 
-            course_files = await get_course_files(course_id)
-            
-            if not course_files:
+            if not snapshot.files:
                 await message.reply_text("No files found for this course.")
                 return
                 
@@ -118,16 +133,8 @@ async def start(client, message):
             welcome_text = f"<b>Fantastic! You're about to dive into the {course['course_name']} course!</b>\n\nI'll send over all the course materials in just a moment. Get ready to learn! 🚀"
             await message.reply_text(welcome_text)
             
-            # Send all course files
-            await send_all_files(client, message.chat.id, course_id, course_files)
-            
-            # Send a message after all files are sent
-            complete_text = f"<b>✅ All files for {course['course_name']} have been sent!</b>\n\nI hope you find it valuable. Happy learning!\n\nReady for more? You can always browse other courses or check out our updates channel."
-            buttons = [[
-                InlineKeyboardButton('🔍 Browse More Courses', switch_inline_query_current_chat=''),
-                InlineKeyboardButton('📢 Updates Channel', url=f"https://t.me/{PUBLIC_CHANNEL}")
-            ]]
-            await message.reply_text(complete_text, reply_markup=InlineKeyboardMarkup(buttons))
+            # Files and the completion message are sent by the delivery queue
+            await delivery_queue.enqueue(message.from_user.id, message.chat.id, course_id)
             return
         
         elif param == 'premium':
@@ -146,7 +153,7 @@ async def start(client, message):
     
     # Regular start command
     buttons = [[
-        InlineKeyboardButton('➕ Add to Group', url=f'http://t.me/{temp.U_NAME}?startgroup=true'),
+        InlineKeyboardButton('➕ Add to Group', url=get_deep_link('true', group=True)),
         InlineKeyboardButton('🔍 Search', switch_inline_query_current_chat='')
     ]]
     
@@ -200,7 +207,7 @@ async def about(client, message):
         InlineKeyboardButton('🔄 Close', callback_data='close_data')
     ]]
     await message.reply_text(
-        text=script.ABOUT_TXT.format(temp.U_NAME, temp.B_NAME, temp.U_NAME),
+        text=script.ABOUT_TXT.format(get_bot_username(), temp.B_NAME, get_bot_username()),
         reply_markup=InlineKeyboardMarkup(buttons),
         disable_web_page_preview=True
     )
@@ -213,20 +220,16 @@ async def stats(client, message):
     user_count = await db.get_user_count()
     chat_count = await db.get_chat_count()
     
-    # Get course and file counts
-    courses, _, total_courses = await get_all_courses(max_results=1)
+    # Get course, file and storage totals (live counters after the first call)
+    catalog = await get_catalog_stats()
+    total_courses = catalog['courses']
+    used_storage = catalog['storage']
     
     # Get premium user count if enabled
     premium_count = 0
     if PREMIUM_ENABLED:
-        premium_users = await db.get_premium_users()
-        premium_count = len(premium_users)
-    
-    # Calculate storage stats
-    from database.db_helpers import calculate_used_storage
-    from database.courses_db import files_col
+        premium_count = await db.get_premium_count()
     
-    used_storage = calculate_used_storage(files_col)
     free_storage = "Unlimited"  # MongoDB Atlas handles storage limits differently
     
     # Create stats message
@@ -242,6 +245,63 @@ async def stats(client, message):
     if PREMIUM_ENABLED:
         stats_text += f"\n\n<b>Premium Users:</b> {premium_count}"
     
+    # Search result cache effectiveness
+    from database.courses_db import get_search_cache_stats
+    search_cache = get_search_cache_stats()
+    stats_text += (
+        f"\n\n<b>Search Cache:</b> {search_cache['hits']} hits, {search_cache['misses']} misses "
+        f"({search_cache['hit_rate']:.0%}), {search_cache['prefix_hits']} narrowed from shorter queries"
+    )
+    
+    # Course snapshot cache
+    from database.courses_db import get_course_cache_stats
+    course_cache = get_course_cache_stats()
+    stats_text += (
+        f"\n<b>Course Cache:</b> {course_cache['size']} courses ({course_cache['weight']} entries), "
+        f"{course_cache['hits']} hits, {course_cache['misses']} misses ({course_cache['hit_rate']:.0%})"
+    )
+    
+    # Connection pool usage, useful for sizing MONGO_MAX_POOL_SIZE
+    from database.db_helpers import get_pool_stats
+    pool = get_pool_stats()
+    stats_text += (
+        f"\n\n<b>DB Pool:</b> {pool['open_connections']} open connections, "
+        f"{pool['checkouts']} checkouts\n"
+        f"<b>Checkout Wait:</b> avg {pool['avg_wait_ms']:.1f} ms, max {pool['max_wait_ms']:.1f} ms"
+    )
+    
+    # Index health, from the registry in database/indexes.py
+    from database.indexes import get_index_report
+    index_report = await get_index_report()
+    stats_text += (
+        f"\n\n<b>Missing Indexes:</b> {', '.join(index_report['missing']) or 'none'}\n"
+        f"<b>Unused Indexes:</b> {', '.join(index_report['unused']) or 'none'}"
+    )
+    
+    # Course delivery queue
+    queue = await delivery_queue.stats()
+    stats_text += (
+        f"\n\n<b>Delivery Queue:</b> {queue['pending']} pending, {queue['running']} running, "
+        f"{queue['done']} done, {queue['failed']} failed\n"
+        f"<b>Duplicate Requests Coalesced:</b> {inflight.stats()['coalesced']}"
+    )
+    
+    # Load shed by the ban guard
+    from database.membership import membership
+    members = membership.stats()
+    stats_text += (
+        f"\n\n<b>Banned:</b> {members['banned_users']} users, {members['banned_chats']} chats, "
+        f"{members['dropped_updates']} updates dropped"
+    )
+    
+    # Outgoing message pacing
+    from ratelimit import send_scheduler
+    sender = send_scheduler.stats()
+    stats_text += (
+        f"\n\n<b>Send Rate:</b> {sender['rate']:.1f}/{sender['max_rate']:.0f} msg/s, "
+        f"{sender['sent']} sent, {sender['flood_waits']} flood waits, {sender['waited']:.0f}s queued"
+    )
+    
     await message.reply_text(
         stats_text,
         parse_mode='html'
@@ -260,89 +320,72 @@ async def old_course_command_alias(client, message):
 
 @Client.on_message(filters.command("broadcast") & filters.user(ADMINS))
 async def broadcast(client, message):
-    """Broadcast a message to all users."""
-    if len(message.command) < 2:
-        return await message.reply_text("Please provide a message to broadcast.")
-        
-    # Get broadcast message
-    broadcast_msg = message.text.split(None, 1)[1]
+    """Broadcast a message to all users, or copy the replied-to message (any media) to them."""
+    if message.reply_to_message:
+        # Copied as-is, so media is never re-uploaded
+        job_id = await create_broadcast(
+            message.from_user.id,
+            from_chat_id=message.chat.id,
+            source_message_id=message.reply_to_message.id
+        )
+        preview = "the message you replied to"
+    elif len(message.command) >= 2:
+        # Get broadcast message
+        broadcast_msg = message.text.split(None, 1)[1]
+        job_id = await create_broadcast(message.from_user.id, broadcast_msg)
+        preview = f"`{broadcast_msg}`"
+    else:
+        return await message.reply_text("Please provide a message to broadcast, or reply to the message you want to broadcast.")
     
     # Send confirmation
-    confirmation = await message.reply_text(
-        text="📢 **Confirm Broadcast** 📢\n\nYou are about to send the following message to ALL users. This action cannot be undone.\n\n`{}`\n\nAre you absolutely sure you want to proceed?".format(broadcast_msg),
+    await message.reply_text(
+        text="📢 **Confirm Broadcast** 📢\n\nYou are about to send {} to ALL users. This action cannot be undone.\n\nAre you absolutely sure you want to proceed?".format(preview),
         reply_markup=InlineKeyboardMarkup([
             [
-                InlineKeyboardButton("✅ Yes, Send Now!", callback_data="broadcast_confirm"),
-                InlineKeyboardButton("❌ No, Cancel", callback_data="broadcast_cancel")
+                InlineKeyboardButton("✅ Yes, Send Now!", callback_data=f"broadcast_confirm_{job_id}"),
+                InlineKeyboardButton("❌ No, Cancel", callback_data=f"broadcast_cancel_{job_id}")
             ]
         ])
     )
-    
-    # Store broadcast message for later use
-    temp.BROADCAST_MSG = broadcast_msg
 
-@Client.on_callback_query(filters.regex("^broadcast_"))
+@Client.on_callback_query(filters.regex("^broadcast_") & filters.user(ADMINS))
 async def broadcast_callback(client, callback_query):
-    """Handle broadcast confirmation callback."""
-    action = callback_query.data.split("_")[1]
+    """Handle broadcast confirmation and pause/resume/cancel buttons."""
+    parts = callback_query.data.split("_")
+    if len(parts) != 3 or not ObjectId.is_valid(parts[2]):
+        return await callback_query.answer("This broadcast has expired.", show_alert=True)
+    action, job_id = parts[1], ObjectId(parts[2])
     
-    if action == "cancel":
-        await callback_query.message.edit_text("Broadcast cancelled.")
-        return
-        
     if action == "confirm":
-        # Start broadcasting
-        broadcast_msg = temp.BROADCAST_MSG
-        await callback_query.message.edit_text("Broadcasting message...")
-        
-        async def send_msg(user_id):
-            try:
-                await client.send_message(user_id, broadcast_msg)
-                return True
-            except UserIsBlocked:
-                await db.ban_user(user_id, "User blocked the bot")
-                return False
-            except InputUserDeactivated:
-                await db.ban_user(user_id, "User account deleted")
-                return False
-            except Exception as e:
-                logger.error(f"Error in broadcast: {e}")
-                return False
+        if await broadcaster.confirm(job_id, callback_query.message.chat.id, callback_query.message.id):
+            await callback_query.answer("Broadcast started.")
+        else:
+            await callback_query.answer("This broadcast was already started or cancelled.", show_alert=True)
         
-        # Get all users
-        users = await db.get_all_users()
-        success = 0
-        failed = 0
+    elif action == "cancel":
+        if await broadcaster.cancel(job_id):
+            await callback_query.answer("Broadcast cancelled.")
+            job = await get_broadcast(job_id)
+            # A running broadcast updates its own message; a paused or unstarted one won't
+            if job and not broadcaster.is_running(job_id):
+                if job.get('message_id'):
+                    await callback_query.message.edit_text(format_progress(job), reply_markup=broadcast_buttons(job_id, job['status']))
+                else:
+                    await callback_query.message.edit_text("Broadcast cancelled.")
+        else:
+            await callback_query.answer("This broadcast has already finished.", show_alert=True)
         
-        # Progress updates
-        start_time = datetime.datetime.now()
-        status_msg = await callback_query.message.edit_text(
-            text=f"Broadcasting in progress...\n\nSuccess: {success}\nFailed: {failed}"
-        )
-        update_interval = 5  # Update status message every 5 seconds
-        last_update_time = start_time
+    elif action == "pause":
+        if await broadcaster.pause(job_id):
+            await callback_query.answer("Pausing after the current batch...")
+        else:
+            await callback_query.answer("This broadcast isn't running.", show_alert=True)
         
-        async for user in users:
-            result = await send_msg(user["_id"])
-            if result:
-                success += 1
-            else:
-                failed += 1
-                
-            # Update status message periodically
-            now = datetime.datetime.now()
-            if (now - last_update_time).total_seconds() >= update_interval:
-                await status_msg.edit_text(
-                    text=f"Broadcasting in progress...\n\nSuccess: {success}\nFailed: {failed}"
-                )
-                last_update_time = now
-                
-        # Final update
-        end_time = datetime.datetime.now()
-        time_taken = (end_time - start_time).total_seconds()
-        await status_msg.edit_text(
-            text=f"✅ Broadcast Completed!\n\nSuccess: {success}\nFailed: {failed}\nTime taken: {time_taken:.2f} seconds"
-        )
+    elif action == "resume":
+        if await broadcaster.resume(job_id):
+            await callback_query.answer("Broadcast resumed.")
+        else:
+            await callback_query.answer("This broadcast isn't paused.", show_alert=True)
 
 @Client.on_callback_query()
 async def cb_handler(client, query):
@@ -380,14 +423,14 @@ async def cb_handler(client, query):
             InlineKeyboardButton('🔄 Close', callback_data='close_data')
         ]]
         await query.message.edit_text(
-            text=script.ABOUT_TXT.format(temp.U_NAME, temp.B_NAME, temp.U_NAME),
+            text=script.ABOUT_TXT.format(get_bot_username(), temp.B_NAME, get_bot_username()),
             reply_markup=InlineKeyboardMarkup(buttons),
             disable_web_page_preview=True
         )
         
     elif data == "start":
         buttons = [[
-            InlineKeyboardButton('➕ Add to Group', url=f'http://t.me/{temp.U_NAME}?startgroup=true'),
+            InlineKeyboardButton('➕ Add to Group', url=get_deep_link('true', group=True)),
             InlineKeyboardButton('🔍 Search', switch_inline_query_current_chat='')
         ]]
         
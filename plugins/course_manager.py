@@ -11,8 +11,11 @@ from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ForceRepl
 from pyrogram.errors import FloodWait, UserIsBlocked, MessageNotModified
 
 from info import ADMINS, CUSTOM_FILE_CAPTION, PUBLIC_CHANNEL
-from database.courses_db import save_course, save_course_file, get_course_by_id, update_course, get_course_files
-from utils import temp, get_size, get_file_id, clean_text
+from database.courses_db import save_course_with_files, get_course_snapshot, update_course, record_course_download
+from utils import temp, get_size, get_file_id, clean_text, get_deep_link, get_progress_bar, batch_course_files, send_file_batch, BatchInterrupted, get_readable_time
+from retry import retry_policy, RetryStats
+from ratelimit import send_scheduler
+from inflight import inflight
 from Script import script
 
 logger = logging.getLogger(__name__)
@@ -23,6 +26,11 @@ WAITING_COURSE_LINKS = 2 # Changed from 3 to 2, as WAITING_COURSE_FILES is remov
 WAITING_BANNER = 3       # Changed from 4 to 3
 CONFIRM_COURSE = 4       # Changed from 5 to 4
 
+# Link ingestion: Telegram returns up to 200 messages per get_messages call
+GET_MESSAGES_LIMIT = 200
+INGEST_CONCURRENCY = 4
+PROGRESS_INTERVAL = 2 # seconds between progress bar edits
+
 # Store conversation states for users
 user_states = {}
 
@@ -164,6 +172,53 @@ async def handle_course_replies(client, message):
                 "Please choose one of the options from the confirmation message (e.g., type 'yes' or '1')."
             )
 
+def normalize_channel_id(channel_id):
+    """Ensure channel_id is correctly formatted (integer for private, string for public)."""
+    if isinstance(channel_id, str) and channel_id.startswith("-100") and channel_id[4:].isdigit():
+        return int(channel_id)
+    if isinstance(channel_id, str) and channel_id.isdigit(): # A public channel ID as string
+        return int(channel_id)
+    return channel_id
+
+async def fetch_linked_messages(client, links, on_progress=None, stats=None):
+    """Fetch the messages behind a list of links, grouped by channel in chunks of GET_MESSAGES_LIMIT.
+    
+    on_progress(done, total) is awaited after each chunk. Returns
+    {(chat_id, message_id): message}; links that couldn't be fetched are missing.
+    """
+    by_channel = {}
+    for link_data in links:
+        chat_id = normalize_channel_id(link_data["channel_id"])
+        by_channel.setdefault(chat_id, {})[link_data["message_id"]] = None
+    
+    fetched = {}
+    done = 0
+    total = sum(len(message_ids) for message_ids in by_channel.values())
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+    
+    async def fetch_chunk(chat_id, message_ids):
+        nonlocal done
+        async with semaphore:
+            await send_scheduler.acquire()
+            try:
+                messages = await retry_policy.call(client.get_messages, chat_id=chat_id, message_ids=message_ids, stats=stats)
+                for fetched_message in messages:
+                    if fetched_message and not fetched_message.empty:
+                        fetched[(chat_id, fetched_message.id)] = fetched_message
+            except Exception as e:
+                logger.error(f"Error fetching messages (chat_id: {chat_id}, {len(message_ids)} ids from {message_ids[0]}): {e}")
+            done += len(message_ids)
+            if on_progress:
+                await on_progress(done, total)
+    
+    chunks = []
+    for chat_id, message_ids in by_channel.items():
+        message_ids = list(message_ids)
+        for i in range(0, len(message_ids), GET_MESSAGES_LIMIT):
+            chunks.append(fetch_chunk(chat_id, message_ids[i:i + GET_MESSAGES_LIMIT]))
+    await asyncio.gather(*chunks)
+    return fetched
+
 @Client.on_message(filters.command("done") & filters.private & filters.user(ADMINS))
 async def done_collecting_links(client, message):
     user_id = message.from_user.id
@@ -181,49 +236,47 @@ async def done_collecting_links(client, message):
     fetched_files_info = []
     success_count = 0
     failed_count = 0
+    retry_stats = RetryStats()
     
-    for link_data in course_data["links"]:
+    links = course_data["links"]
+    last_edit = 0
+    
+    async def show_progress(done, total):
+        nonlocal last_edit
+        if done < total and time.monotonic() - last_edit < PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
         try:
-            # Ensure channel_id is correctly formatted (integer for private, string for public)
-            chat_id_to_fetch = link_data["channel_id"]
-            if isinstance(chat_id_to_fetch, str) and chat_id_to_fetch.startswith("-100") and chat_id_to_fetch[4:].isdigit():
-                 chat_id_to_fetch = int(chat_id_to_fetch)
-            elif isinstance(chat_id_to_fetch, str) and chat_id_to_fetch.isdigit(): # A public channel ID as string
-                 chat_id_to_fetch = int(chat_id_to_fetch)
-
-
-            fetched_message = await client.get_messages(
-                chat_id=chat_id_to_fetch, 
-                message_ids=link_data["message_id"]
-            )
-            
-            if fetched_message and fetched_message.media:
-                file_obj, file_id = get_file_id(fetched_message)
-                if file_id:
-                    fetched_files_info.append({
-                        "file_id": file_id,
-                        "file_name": getattr(file_obj, "file_name", f"File from {link_data['message_id']}"),
-                        "file_size": getattr(file_obj, "file_size", 0),
-                        "caption": fetched_message.caption, # Or use CUSTOM_FILE_CAPTION later
-                        "message_id": fetched_message.id # Original message_id from source channel
-                    })
-                    success_count += 1
-                else:
-                    failed_count += 1
-                    logger.warning(f"Could not get file_id from fetched message: chat={chat_id_to_fetch}, msg_id={link_data['message_id']}")
+            await processing_msg.edit_text(f"Processing message links... ⏳\n\n{get_progress_bar(done, total)} ({done}/{total})")
+        except MessageNotModified:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not update link processing progress: {e}")
+    
+    fetched_messages = await fetch_linked_messages(client, links, show_progress, retry_stats)
+    
+    # Keep the files in the order the links were sent
+    for link_data in links:
+        chat_id_to_fetch = normalize_channel_id(link_data["channel_id"])
+        fetched_message = fetched_messages.get((chat_id_to_fetch, link_data["message_id"]))
+        
+        if fetched_message and fetched_message.media:
+            file_obj, file_id = get_file_id(fetched_message)
+            if file_id:
+                fetched_files_info.append({
+                    "file_id": file_id,
+                    "file_name": getattr(file_obj, "file_name", f"File from {link_data['message_id']}"),
+                    "file_size": getattr(file_obj, "file_size", 0),
+                    "caption": fetched_message.caption, # Or use CUSTOM_FILE_CAPTION later
+                    "message_id": fetched_message.id # Original message_id from source channel
+                })
+                success_count += 1
             else:
                 failed_count += 1
-                logger.warning(f"Fetched message has no media or message not found: chat={chat_id_to_fetch}, msg_id={link_data['message_id']}")
-        except FloodWait as e:
-            logger.warning(f"FloodWait: Sleeping for {e.x} seconds while fetching links.")
-            await processing_msg.edit_text(f"Hit a small delay, waiting for {e.x}s. Processing will resume...")
-            await asyncio.sleep(e.x)
-            # Optionally, retry this specific link or just count as failed for now
-            failed_count +=1 # Count as failed for now
-        except Exception as e:
-            logger.error(f"Error fetching message (chat_id: {link_data['channel_id']}, message_id: {link_data['message_id']}): {e}")
+                logger.warning(f"Could not get file_id from fetched message: chat={chat_id_to_fetch}, msg_id={link_data['message_id']}")
+        else:
             failed_count += 1
-            continue
+            logger.warning(f"Fetched message has no media or message not found: chat={chat_id_to_fetch}, msg_id={link_data['message_id']}")
             
     await processing_msg.delete() # Delete the "Processing..." message
 
@@ -238,6 +291,7 @@ async def done_collecting_links(client, message):
     
     await message.reply_text(
         f"Great! I successfully processed **{success_count}** file(s) from the links. 🎉"
+        + (f" ({retry_stats.retried} fetch(es) had to be retried.)" if retry_stats.retried else "")
         + (f" ({failed_count} link(s) could not be processed.)" if failed_count > 0 else "")
         + "\n\nNext, would you like to add a **banner image** for this course? This image will be shown in announcements.\n\n"
         "Please send the image now, or type /skip to use a default banner.",
@@ -361,12 +415,8 @@ async def publish_course(client, message_or_callback_query, user_id):
         "total_size": sum(file_info.get("file_size", 0) for file_info in course_data.get("files", []))
     }
     
-    success_db, _ = await save_course(course_doc)
-    if not success_db:
-        return await reply_target.reply_text("Failed to save course to database. Please try again or contact support. ⚠️")
-    
-    for i, file_info in enumerate(course_data.get("files", [])):
-        file_doc = {
+    file_docs = [
+        {
             "course_id": course_id,
             "file_id": file_info["file_id"], # The actual file_id from the source message
             "file_name": file_info["file_name"],
@@ -375,7 +425,12 @@ async def publish_course(client, message_or_callback_query, user_id):
             "caption": file_info.get("caption") or CUSTOM_FILE_CAPTION.format(file_name=file_info["file_name"], course_name=course_doc["course_name"]),
             "file_order": i + 1 
         }
-        await save_course_file(file_doc)
+        for i, file_info in enumerate(course_data.get("files", []))
+    ]
+    
+    # Course and files are written together, so a failure never leaves a partial course
+    if not await save_course_with_files(course_doc, file_docs):
+        return await reply_target.reply_text("Failed to save course to database. Please try again or contact support. ⚠️")
     
     await reply_target.reply_text(script.COURSE_CONFIRM.format(course_name=course_doc["course_name"]))
     await announce_course(client, course_id, course_data) # Pass client object
@@ -390,7 +445,7 @@ async def announce_course(client, course_id, course_data): # Added client here
     
     caption = script.COURSE_ADDED.format(course_name=course_name)
     buttons = [[
-        InlineKeyboardButton("⬇️ Download Now", url=f"https://t.me/{temp.U_NAME}?start=course_{course_id}")
+        InlineKeyboardButton("⬇️ Download Now", url=get_deep_link(f"course_{course_id}"))
     ]]
     reply_markup = InlineKeyboardMarkup(buttons)
     
@@ -471,11 +526,11 @@ async def course_callback(client, callback_query):
     """Handle course selection callback from search or other lists."""
     course_id = callback_query.data.split("_")[1]
     
-    course = await get_course_by_id(course_id)
-    if not course:
+    snapshot = await get_course_snapshot(course_id)
+    if not snapshot:
         return await callback_query.answer("Sorry, this course could not be found. It might have been removed.", show_alert=True)
     
-    files = await get_course_files(course_id)
+    course, files = snapshot.course, snapshot.files
     if not files:
         return await callback_query.answer("This course currently has no files. Please check back later.", show_alert=True)
     
@@ -542,48 +597,80 @@ async def send_single_file_callback(client, callback_query):
 @Client.on_callback_query(filters.regex(r"^sendall_([0-9a-f-]+)$"))
 async def send_all_files_callback(client, callback_query):
     course_id = callback_query.data.split("_")[1]
+    user_id = callback_query.from_user.id
     
-    course = await get_course_by_id(course_id)
-    if not course:
+    # Repeat taps get the running delivery's progress instead of a second send loop
+    reason, active = inflight.check(user_id, course_id)
+    if reason:
+        return await callback_query.answer(inflight.coalesce(reason, active), show_alert=True)
+    delivery = inflight.start(user_id, course_id)
+    try:
+        await send_course_files(client, callback_query, course_id, delivery)
+    finally:
+        inflight.finish(delivery)
+
+async def send_course_files(client, callback_query, course_id, delivery):
+    """Send every file of a course to the chat a 'Download All' button was tapped in."""
+    snapshot = await get_course_snapshot(course_id)
+    if not snapshot:
         return await callback_query.answer("Course not found.", show_alert=True)
     
-    files = await get_course_files(course_id)
+    course, files = snapshot.course, snapshot.files
     if not files:
         return await callback_query.answer("No files found for this course.", show_alert=True)
     
+    delivery.total = len(files)
     await callback_query.answer("Sending all files. This might take a moment...", show_alert=False)
     status_message = await callback_query.message.reply_text(f"Preparing to send {len(files)} files for '{course['course_name']}'...")
     
     sent_count = 0
     failed_send_count = 0
-    for file_doc in files:
+    interrupted = None
+    retry_stats = RetryStats()
+    for batch in batch_course_files(files):
+        # Use the caption stored in the database for each file
+        captions = [
+            file_doc.get("caption", CUSTOM_FILE_CAPTION.format(file_name=file_doc["file_name"], course_name=course["course_name"]))
+            for file_doc in batch
+        ]
         try:
-            # Use the caption stored in the database for each file
-            caption_to_use = file_doc.get("caption", CUSTOM_FILE_CAPTION.format(file_name=file_doc["file_name"], course_name=course["course_name"]))
-            await client.send_cached_media(
-                chat_id=callback_query.message.chat.id,
-                file_id=file_doc['file_id'],
-                caption=caption_to_use 
-            )
-            sent_count += 1
-            if sent_count % 5 == 0 and sent_count < len(files): # Avoid final update here
+            sent = await send_file_batch(client, callback_query.message.chat.id, batch, captions, stats=retry_stats)
+            failed_send_count += len(batch) - sent
+            previous_count = sent_count
+            sent_count += sent
+            delivery.sent, delivery.failed = sent_count, failed_send_count
+            if sent_count // 5 > previous_count // 5 and sent_count < len(files): # Avoid final update here
                 try:
                     await status_message.edit_text(f"Sent {sent_count}/{len(files)} files for '{course['course_name']}'...")
                 except MessageNotModified:
                     pass
-            await asyncio.sleep(1) # Small delay
-        except FloodWait as e:
-            logger.warning(f"FloodWait: Sleeping for {e.x} seconds during send_all for course {course_id}.")
-            await status_message.edit_text(f"Delay encountered, waiting {e.x}s. Will resume sending...")
-            await asyncio.sleep(e.x)
-            # Retry sending this file? For now, we'll just count it as failed and continue.
-            failed_send_count += 1
+        except BatchInterrupted as e:
+            # Telegram wants a longer pause than the retry policy waits out; stop
+            # here rather than count the unsent files as failed
+            interrupted = e
+            sent_count += e.sent
+            failed_send_count += e.done - e.sent
+            delivery.sent, delivery.failed = sent_count, failed_send_count
+            break
         except Exception as e:
-            logger.error(f"Error sending file {file_doc['file_name']} for course {course_id}: {e}")
-            failed_send_count += 1
+            # Only reached once the retry budget is spent
+            logger.error(f"Error sending files for course {course_id}: {e}")
+            failed_send_count += len(batch)
+            delivery.failed = failed_send_count
+    
+    if sent_count:
+        await record_course_download(course_id)
     
     final_status_text = f"✅ Successfully sent {sent_count} files for '{course['course_name']}'."
+    if retry_stats.retried:
+        final_status_text += f" ({retry_stats.retried} send(s) retried.)"
     if failed_send_count > 0:
         final_status_text += f" ({failed_send_count} file(s) failed to send.)"
+    if interrupted:
+        remaining = len(files) - sent_count - failed_send_count
+        final_status_text += (
+            f"\n\n⏸ Telegram asked us to pause for {get_readable_time(interrupted.error.value)}, "
+            f"so {remaining} file(s) were not sent. Please try again later."
+        )
     
     await status_message.edit_text(final_status_text) 
\ No newline at end of file
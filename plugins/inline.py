@@ -11,8 +11,8 @@ from pyrogram.types import (
 )
 from pyrogram.errors import FloodWait, UserIsBlocked
 
-from database.courses_db import search_courses, get_course_by_id, get_course_files
-from utils import temp, get_size, extract_course_id, get_shortlink
+from database.courses_db import search_courses, get_course_snapshot, add_course_listener
+from utils import temp, get_size, extract_course_id, get_shortlink, get_deep_link
 from info import ADMINS, CUSTOM_FILE_CAPTION, SHORTENER_ENABLED
 from Script import script
 
@@ -43,8 +43,14 @@ async def inline_search(client, query):
         )
         return
     
-    # Search for courses
-    courses, _, total = await search_courses(search_text, max_results=20)
+    # Search for courses, tolerating typos since inline queries are typed on the fly.
+    # query.offset carries the keyset cursor of the previous page when scrolling.
+    courses, next_offset, total = await search_courses(search_text, max_results=20, offset=query.offset, fuzzy=True)
+    
+    if not courses and query.offset:
+        # Scrolled past the last page
+        await query.answer(results=[], cache_time=300)
+        return
     
     if not courses:
         # No results found
@@ -63,95 +69,94 @@ async def inline_search(client, query):
         )
         return
     
-    # Convert courses to inline results
+    # Convert courses to inline results, reusing prebuilt ones where possible
     results = []
     for course in courses:
-        course_id = course['course_id']
-        course_name = course['course_name']
-        file_count = course['file_count']
-        total_size = course.get('total_size', 0)
-        banner_id = course.get('banner_id')
-        
-        # Create deep link for course
-        bot_username = (await client.get_me()).username
-        deep_link = f"https://t.me/{bot_username}?start=course_{course_id}"
-        
-        # Use URL shortener if enabled
-        if SHORTENER_ENABLED:
-            deep_link = await get_shortlink(deep_link)
-        
-        # Create description and message content
-        description = f"{file_count} files • {get_size(total_size)}"
-        message_content = InputTextMessageContent(
-            f"**📚 {course_name}**\n\n"
-            f"Files: {file_count}\n"
-            f"Total Size: {get_size(total_size)}\n\n"
-            f"Use the button below to access this course."
-        )
-        
-        # Create reply markup with download button
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬇️ Download Course", url=deep_link)]
-        ])
-        
-        # If course has a banner, use photo result
-        if banner_id:
-            try:
-                # Add as photo result if banner exists
-                results.append(
-                    InlineQueryResultPhoto(
-                        photo_url=f"https://t.me/c/{str(banner_id).split('_')[0]}/{str(banner_id).split('_')[1]}",
-                        thumb_url=f"https://t.me/c/{str(banner_id).split('_')[0]}/{str(banner_id).split('_')[1]}",
-                        title=course_name,
-                        description=description,
-                        caption=f"**📚 {course_name}**\n\n"
-                                f"Files: {file_count}\n"
-                                f"Total Size: {get_size(total_size)}",
-                        reply_markup=reply_markup
-                    )
-                )
-            except Exception as e:
-                # Fallback to article if there's an issue with the photo
-                logger.error(f"Error creating photo result: {e}")
-                results.append(
-                    InlineQueryResultArticle(
-                        title=course_name,
-                        description=description,
-                        input_message_content=message_content,
-                        reply_markup=reply_markup,
-                        thumb_url="https://i.imgur.com/ede5DtC.png"
-                    )
-                )
-        else:
-            # Use article result for courses without banner
-            results.append(
-                InlineQueryResultArticle(
-                    title=course_name,
-                    description=description,
-                    input_message_content=message_content,
-                    reply_markup=reply_markup,
-                    thumb_url="https://i.imgur.com/ede5DtC.png"
-                )
-            )
+        result = temp.INLINE_RESULTS.get(course['course_id'])
+        if result is None:
+            result = await build_course_result(client, course)
+            temp.INLINE_RESULTS.set(course['course_id'], result)
+        results.append(result)
     
     # Answer the query with results
     await query.answer(
         results=results,
-        cache_time=300  # Cache for 5 minutes
+        cache_time=300,  # Cache for 5 minutes
+        next_offset=next_offset
     )
 
+async def build_course_result(client, course):
+    """Build the inline query result shown for a course."""
+    course_id = course['course_id']
+    course_name = course['course_name']
+    file_count = course['file_count']
+    total_size = course.get('total_size', 0)
+    banner_id = course.get('banner_id')
+    
+    # Create deep link for course
+    deep_link = get_deep_link(f"course_{course_id}")
+    
+    # Use URL shortener if enabled
+    if SHORTENER_ENABLED:
+        deep_link = await get_shortlink(deep_link)
+    
+    # Create description and message content
+    description = f"{file_count} files • {get_size(total_size)}"
+    message_content = InputTextMessageContent(
+        f"**📚 {course_name}**\n\n"
+        f"Files: {file_count}\n"
+        f"Total Size: {get_size(total_size)}\n\n"
+        f"Use the button below to access this course."
+    )
+    
+    # Create reply markup with download button
+    reply_markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton("⬇️ Download Course", url=deep_link)]
+    ])
+    
+    # If course has a banner, use photo result
+    if banner_id:
+        try:
+            # Add as photo result if banner exists
+            return InlineQueryResultPhoto(
+                id=course_id,
+                photo_url=f"https://t.me/c/{str(banner_id).split('_')[0]}/{str(banner_id).split('_')[1]}",
+                thumb_url=f"https://t.me/c/{str(banner_id).split('_')[0]}/{str(banner_id).split('_')[1]}",
+                title=course_name,
+                description=description,
+                caption=f"**📚 {course_name}**\n\n"
+                        f"Files: {file_count}\n"
+                        f"Total Size: {get_size(total_size)}",
+                reply_markup=reply_markup
+            )
+        except Exception as e:
+            # Fallback to article if there's an issue with the photo
+            logger.error(f"Error creating photo result: {e}")
+    
+    # Use article result for courses without banner
+    return InlineQueryResultArticle(
+        id=course_id,
+        title=course_name,
+        description=description,
+        input_message_content=message_content,
+        reply_markup=reply_markup,
+        thumb_url="https://i.imgur.com/ede5DtC.png"
+    )
+
+# Drop prebuilt results whenever a course is created, updated or deleted
+add_course_listener(temp.INLINE_RESULTS.pop)
+
 @Client.on_message(filters.command("course") & filters.regex(r"_([0-9a-f-]+)$"))
 async def get_course_from_deeplink(client, message):
     """Handle deep links for courses."""
     course_id = message.command[1].split("_")[1]
     
     # Get course details
-    course = await get_course_by_id(course_id)
-    if not course:
+    snapshot = await get_course_snapshot(course_id)
+    if not snapshot:
         return await message.reply_text("Course not found or has been removed.")
     
-    # Get course files
-    files = await get_course_files(course_id)
+    course, files = snapshot.course, snapshot.files
     if not files:
         return await message.reply_text("No files found for this course.")
     
@@ -1,11 +1,11 @@
 import logging
-import asyncio
 from datetime import datetime, timedelta
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 from info import ADMINS, PREMIUM_ENABLED
 from database.users_chats_db import db
-from utils import temp, get_readable_time
+from utils import get_readable_time, get_deep_link
+from premium_expiry import expiry_scheduler
 from Script import script
 
 logger = logging.getLogger(__name__)
@@ -68,7 +68,7 @@ async def premium_command(client, message):
     else:
         # User is not premium, show available plans
         buttons = [
-            [InlineKeyboardButton("Contact Admin for Premium", url=f"https://t.me/{(await client.get_me()).username}?start=premium")]
+            [InlineKeyboardButton("Contact Admin for Premium", url=get_deep_link("premium"))]
         ]
         
         await message.reply_text(
@@ -102,17 +102,9 @@ async def set_premium_command(client, message):
             user_id = int(user_arg)
         except ValueError:
             # If not an integer, assume it's a username
-            if user_arg.startswith("@"):
-                user_arg = user_arg[1:]
-            # Try to get user from database by username
-            users = await db.get_all_users()
-            user_found = False
-            async for user in users:
-                if user.get("username") == user_arg:
-                    user_id = user["_id"]
-                    user_found = True
-                    break
-            if not user_found:
+            user_arg = user_arg.lstrip("@")
+            user_id = await db.get_user_id_by_username(user_arg)
+            if user_id is None:
                 return await message.reply_text(f"User with username @{user_arg} not found in database.")
         
         # Get duration in days
@@ -132,9 +124,7 @@ async def set_premium_command(client, message):
         success = await db.set_premium_status(user_id, True, expiry_date)
         
         if success:
-            # Add to cache
-            if user_id not in temp.PREMIUM_USERS:
-                temp.PREMIUM_USERS.append(user_id)
+            expiry_scheduler.schedule(user_id, expiry_date)
                 
             await message.reply_text(
                 f"✅ Successfully set premium status for user {user_id}.\n\n"
@@ -166,26 +156,16 @@ async def remove_premium_command(client, message):
             user_id = int(user_arg)
         except ValueError:
             # If not an integer, assume it's a username
-            if user_arg.startswith("@"):
-                user_arg = user_arg[1:]
-            # Try to get user from database by username
-            users = await db.get_all_users()
-            user_found = False
-            async for user in users:
-                if user.get("username") == user_arg:
-                    user_id = user["_id"]
-                    user_found = True
-                    break
-            if not user_found:
+            user_arg = user_arg.lstrip("@")
+            user_id = await db.get_user_id_by_username(user_arg)
+            if user_id is None:
                 return await message.reply_text(f"User with username @{user_arg} not found in database.")
         
         # Remove premium status
         success = await db.set_premium_status(user_id, False)
         
         if success:
-            # Remove from cache
-            if user_id in temp.PREMIUM_USERS:
-                temp.PREMIUM_USERS.remove(user_id)
+            expiry_scheduler.unschedule(user_id)
                 
             await message.reply_text(f"✅ Successfully removed premium status for user {user_id}.")
         else:
@@ -248,17 +228,9 @@ async def check_premium_command(client, message):
             user_id = int(user_arg)
         except ValueError:
             # If not an integer, assume it's a username
-            if user_arg.startswith("@"):
-                user_arg = user_arg[1:]
-            # Try to get user from database by username
-            users = await db.get_all_users()
-            user_found = False
-            async for user in users:
-                if user.get("username") == user_arg:
-                    user_id = user["_id"]
-                    user_found = True
-                    break
-            if not user_found:
+            user_arg = user_arg.lstrip("@")
+            user_id = await db.get_user_id_by_username(user_arg)
+            if user_id is None:
                 return await message.reply_text(f"User with username @{user_arg} not found in database.")
         
         # Get user details
@@ -303,20 +275,3 @@ async def check_premium_command(client, message):
     except Exception as e:
         logger.error(f"Error checking premium status: {e}")
         await message.reply_text(f"❌ An error occurred: {str(e)}")
-
-# Run task to check for expired premium subscriptions
-async def check_expired_premiums():
-    """Task to periodically check for expired premium subscriptions."""
-    while True:
-        try:
-            count = await db.process_expired_premiums()
-            if count > 0:
-                logger.info(f"Processed {count} expired premium subscriptions")
-        except Exception as e:
-            logger.error(f"Error processing expired premiums: {e}")
-        
-        # Run every hour
-        await asyncio.sleep(3600)
-
-# Start the task when the plugin is loaded
-asyncio.create_task(check_expired_premiums()) 
\ No newline at end of file
@@ -0,0 +1,108 @@
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from database.users_chats_db import db
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Only expiries within this window are held in memory; the window is reloaded as it runs out
+LOAD_HORIZON = timedelta(days=1)
+# Seconds to wait before retrying expiries the database failed to apply
+RETRY_DELAY = 30
+
+class ExpiryScheduler:
+    """Expires premium subscriptions at their deadline.
+
+    Upcoming expiries sit in a min-heap and the scheduler sleeps until the
+    earliest one. Entries changed by schedule()/unschedule() are skipped
+    when popped rather than removed from the heap.
+    """
+
+    def __init__(self, horizon=LOAD_HORIZON):
+        self.horizon = horizon
+        self._heap = []  # (expiry, user_id)
+        self._expiries = {}  # user_id -> current expiry
+        self._loaded_until = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._retry_at = None
+
+    async def start(self):
+        if self._task:
+            return
+        await self._load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def schedule(self, user_id, expiry):
+        """Track a new or changed expiry date for a user."""
+        self._expiries[user_id] = expiry
+        if self._loaded_until and expiry <= self._loaded_until:
+            heapq.heappush(self._heap, (expiry, user_id))
+            self._wakeup.set()
+
+    def unschedule(self, user_id):
+        """Forget a user whose premium was removed by hand."""
+        self._expiries.pop(user_id, None)
+
+    async def _load(self):
+        self._loaded_until = datetime.now() + self.horizon
+        upcoming = await db.get_premium_expiries(self._loaded_until)
+        self._expiries = dict(upcoming)
+        self._heap = [(expiry, user_id) for user_id, expiry in upcoming]
+        heapq.heapify(self._heap)
+        logger.info(f"Scheduled {len(self._heap)} premium expiries")
+
+    async def _expire_due(self):
+        now = datetime.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expiry, user_id = heapq.heappop(self._heap)
+            if self._expiries.get(user_id) == expiry:
+                due.append((expiry, user_id))
+        if not due:
+            return
+        try:
+            # Also drops them from the in-memory premium set
+            expired = await db.expire_premium_users([user_id for _, user_id in due], now)
+        except Exception:
+            # Keep them scheduled so the next attempt expires them
+            for entry in due:
+                heapq.heappush(self._heap, entry)
+            self._retry_at = now + timedelta(seconds=RETRY_DELAY)
+            raise
+        self._retry_at = None
+        for expiry, user_id in due:
+            # schedule() may have moved the expiry while the update ran
+            if self._expiries.get(user_id) == expiry:
+                del self._expiries[user_id]
+        logger.info(f"Expired {expired} premium subscriptions")
+
+    async def _run(self):
+        while True:
+            try:
+                await self._expire_due()
+                if datetime.now() >= self._loaded_until:
+                    await self._load()
+                    continue
+            except Exception as e:
+                logger.error(f"Error expiring premium subscriptions: {e}")
+
+            deadline = self._heap[0][0] if self._heap else self._loaded_until
+            if self._retry_at:
+                deadline = max(deadline, self._retry_at)
+            timeout = min(deadline, self._loaded_until) - datetime.now()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(timeout.total_seconds(), 1))
+            except asyncio.TimeoutError:
+                pass
+
+expiry_scheduler = ExpiryScheduler()
@@ -0,0 +1,161 @@
+import time
+import asyncio
+import logging
+from pyrogram import raw, utils as pyrogram_utils
+from pyrogram.errors import FloodWait
+from database.cache import LRUCache
+from info import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_GROUP_RATE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Raw API calls that post a message, and the attribute holding the target peer
+SEND_QUERIES = {
+    raw.functions.messages.SendMessage: "peer",
+    raw.functions.messages.SendMedia: "peer",
+    raw.functions.messages.SendMultiMedia: "peer",
+    raw.functions.messages.ForwardMessages: "to_peer"
+}
+
+# Adaptive global rate: halve it on FloodWait, then win it back a little per send
+DECREASE_FACTOR = 0.5
+RECOVERY_STEP = 0.01  # fraction of the configured rate regained per successful send
+MIN_RATE_FACTOR = 0.1
+
+MAX_CHAT_BUCKETS = 10000
+
+def peer_chat_id(peer):
+    """Return the bot API chat id for a raw input peer, or None for peers we don't limit."""
+    if isinstance(peer, (raw.types.InputPeerUser, raw.types.InputPeerUserFromMessage)):
+        return peer.user_id
+    if isinstance(peer, raw.types.InputPeerChat):
+        return -peer.chat_id
+    if isinstance(peer, (raw.types.InputPeerChannel, raw.types.InputPeerChannelFromMessage)):
+        return pyrogram_utils.get_channel_id(peer.channel_id)
+    return None
+
+def query_chat_id(query):
+    """Return the chat a raw query sends a message to, or None if it isn't a send."""
+    attr = SEND_QUERIES.get(type(query))
+    if attr is None:
+        return None
+    return peer_chat_id(getattr(query, attr, None))
+
+class TokenBucket:
+    """Token bucket refilling at `rate` tokens per second, up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        """Return how many seconds until a token can be taken."""
+        self._refill(now)
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+    def set_rate(self, rate):
+        self._refill(time.monotonic())
+        self.rate = rate
+
+    def block(self, seconds):
+        """Hold the bucket empty for the next `seconds` seconds."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class SendScheduler:
+    """Paces outgoing messages through a global and per-chat token buckets.
+
+    The global rate backs off whenever Telegram answers with FloodWait and
+    recovers gradually as sends succeed again.
+    """
+
+    def __init__(self, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE, group_rate=SEND_GROUP_RATE / 60):
+        self.max_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chats = LRUCache(MAX_CHAT_BUCKETS)
+        self.sent = 0
+        self.flood_waits = 0
+        self.waited = 0.0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chats.get(chat_id, count=False)
+        if bucket is None:
+            # Private chats have positive ids, groups and channels negative ones
+            bucket = TokenBucket(self.chat_rate if chat_id > 0 else self.group_rate)
+            self.chats.set(chat_id, bucket)
+        return bucket
+
+    async def acquire(self, chat_id=None):
+        """Wait until both the global and the chat's bucket allow another request.
+
+        Without a chat_id only the global budget is used, for bulk calls that
+        don't post to a chat.
+        """
+        chat = self._chat_bucket(chat_id) if chat_id is not None else None
+        started = time.monotonic()
+        while True:
+            now = time.monotonic()
+            wait = self.global_bucket.wait_time(now)
+            if chat is not None:
+                wait = max(wait, chat.wait_time(now))
+            if wait <= 0:
+                self.global_bucket.take()
+                if chat is not None:
+                    chat.take()
+                self.waited += now - started
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        self.sent += 1
+        if self.global_bucket.rate < self.max_rate:
+            self.global_bucket.set_rate(min(self.max_rate, self.global_bucket.rate + RECOVERY_STEP * self.max_rate))
+
+    def on_flood_wait(self, chat_id, seconds):
+        self.flood_waits += 1
+        self._chat_bucket(chat_id).block(seconds)
+        rate = max(self.max_rate * MIN_RATE_FACTOR, self.global_bucket.rate * DECREASE_FACTOR)
+        self.global_bucket.set_rate(rate)
+        logger.warning(f"FloodWait of {seconds}s in chat {chat_id}, global send rate lowered to {rate:.1f}/s")
+
+    async def run(self, chat_id, send, sleep_threshold=0):
+        """Await send() when the chat's turn comes.
+
+        FloodWaits up to sleep_threshold seconds are waited out and the send is
+        retried; longer ones are raised to the caller.
+        """
+        while True:
+            await self.acquire(chat_id)
+            try:
+                result = await send()
+            except FloodWait as e:
+                self.on_flood_wait(chat_id, e.value)
+                if e.value > sleep_threshold:
+                    raise
+                continue
+            self.on_success()
+            return result
+
+    def stats(self):
+        return {
+            "rate": self.global_bucket.rate,
+            "max_rate": self.max_rate,
+            "sent": self.sent,
+            "flood_waits": self.flood_waits,
+            "waited": self.waited
+        }
+
+send_scheduler = SendScheduler()
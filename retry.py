@@ -0,0 +1,75 @@
+import random
+import asyncio
+import logging
+from pyrogram.errors import Flood, InternalServerError, ServiceUnavailable
+from info import RETRY_MAX_ATTEMPTS, RETRY_MAX_WAIT
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Error classes
+RETRY_AFTER = "retry_after"  # Telegram told us how long to wait
+TRANSIENT = "transient"      # server or network hiccup, back off and try again
+PERMANENT = "permanent"      # retrying won't help (blocked, bad request, ...)
+
+def classify_error(error):
+    """Return how a failed call should be treated: RETRY_AFTER, TRANSIENT or PERMANENT."""
+    if isinstance(error, Flood) and isinstance(getattr(error, "value", None), int):
+        return RETRY_AFTER
+    if isinstance(error, (InternalServerError, ServiceUnavailable, asyncio.TimeoutError, OSError)):
+        return TRANSIENT
+    return PERMANENT
+
+class RetryStats:
+    """Retried calls and calls given up on, for progress messages."""
+
+    def __init__(self):
+        self.retried = 0
+        self.failed = 0
+
+class RetryPolicy:
+    """Retries awaitable calls with per-error handling and a bounded attempt budget.
+
+    FloodWait-style errors wait the time Telegram asks for (up to max_wait),
+    transient errors back off exponentially with full jitter, and anything
+    else is raised straight away.
+    """
+
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=1.0, max_delay=30.0, max_wait=RETRY_MAX_WAIT):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+
+    def delay_for(self, error, attempt):
+        """Return seconds to wait before the next attempt, or None to give up."""
+        if attempt >= self.max_attempts:
+            return None
+        kind = classify_error(error)
+        if kind == RETRY_AFTER:
+            if error.value > self.max_wait:
+                return None
+            return error.value + random.uniform(0, 1)
+        if kind == TRANSIENT:
+            return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return None
+
+    async def call(self, func, *args, stats=None, **kwargs):
+        """Await func(*args, **kwargs), retrying per the policy. The last error is raised."""
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                delay = self.delay_for(e, attempt)
+                if delay is None:
+                    if stats is not None:
+                        stats.failed += 1
+                    raise
+                if stats is not None:
+                    stats.retried += 1
+                logger.warning(f"Retrying {getattr(func, '__name__', 'call')} in {delay:.1f}s (attempt {attempt + 1}) after {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+
+retry_policy = RetryPolicy()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# info.py reads these at import time; the Mongo client connects lazily, so
+# nothing here talks to a server
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("LOG_CHANNEL", "-100")
+os.environ.setdefault("DATABASE_URI", "mongodb://localhost:27017")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+import asyncio
+import broadcast
+from broadcast import Broadcaster
+from database.broadcast_db import RUNNING, PAUSED
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+class FakeUsers:
+    """Returns one batch of users, then fails like a dropped Mongo connection."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def get_user_id_batch(self, after=None, limit=100):
+        self.calls += 1
+        if self.calls > 1:
+            raise ConnectionError("connection lost")
+        return [1, 2, 3]
+
+    async def mark_unreachable(self, failures):
+        return 0
+
+def test_error_pauses_broadcast_and_releases_slots(monkeypatch):
+    job = {
+        '_id': 'job', 'status': RUNNING, 'text': 'hi', 'chat_id': 1, 'message_id': 1,
+        'last_user_id': None, 'total': 3, 'sent': 0, 'failed': 0, 'retried': 0, 'errors': {}
+    }
+    statuses = []
+    updates = {}
+
+    async def get_broadcast(job_id):
+        return dict(job)
+
+    async def set_broadcast_status(job_id, status, from_statuses):
+        statuses.append(status)
+        return True
+
+    async def update_broadcast(job_id, **fields):
+        updates.update(fields)
+
+    async def save_broadcast_progress(*args):
+        pass
+
+    monkeypatch.setattr(broadcast, "db", FakeUsers())
+    monkeypatch.setattr(broadcast, "get_broadcast", get_broadcast)
+    monkeypatch.setattr(broadcast, "set_broadcast_status", set_broadcast_status)
+    monkeypatch.setattr(broadcast, "update_broadcast", update_broadcast)
+    monkeypatch.setattr(broadcast, "save_broadcast_progress", save_broadcast_progress)
+
+    broadcaster = Broadcaster(concurrency=2, batch_size=3)
+    broadcaster._bot = FakeBot()
+    asyncio.run(broadcaster._run('job'))
+
+    assert broadcaster._bot.sent == [1, 2, 3]
+    assert statuses == [PAUSED]
+    assert updates == {'error': 'connection lost'}
+    assert broadcaster._slots.free == 2
+
+def test_cancelling_paused_broadcast_updates_its_message(monkeypatch):
+    from types import SimpleNamespace
+    from bson import ObjectId
+    from plugins import commands
+    job_id = ObjectId()
+    job = {"_id": job_id, "status": "cancelled", "message_id": 5, "chat_id": 1, "total": 10,
+           "sent": 4, "failed": 0, "retried": 0, "errors": {}}
+    edits = []
+
+    async def cancel(job_id):
+        return True
+
+    async def get_broadcast(job_id):
+        return job
+
+    async def answer(*args, **kwargs):
+        pass
+
+    async def edit_text(text, reply_markup=None):
+        edits.append((text, reply_markup))
+
+    monkeypatch.setattr(commands.broadcaster, "cancel", cancel)
+    monkeypatch.setattr(commands, "get_broadcast", get_broadcast)
+    query = SimpleNamespace(data=f"broadcast_cancel_{job_id}", answer=answer, message=SimpleNamespace(edit_text=edit_text))
+    asyncio.run(commands.broadcast_callback(None, query))
+
+    assert len(edits) == 1
+    text, buttons = edits[0]
+    assert text.startswith("❌ Broadcast cancelled") and "4/10" in text
+    assert buttons is None
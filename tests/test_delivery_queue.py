@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+import delivery
+from delivery import DeliveryQueue
+
+class UnreachableBot:
+    async def send_message(self, *args, **kwargs):
+        raise ConnectionError("connection lost")
+
+def test_completion_message_failure_still_finishes_and_records_once(monkeypatch):
+    finished = []
+    downloads = []
+    files = [{"file_id": "f0"}, {"file_id": "f1"}]
+
+    async def get_course_snapshot(course_id):
+        return SimpleNamespace(course={"course_name": "Endgames"}, files=files)
+
+    async def send_all_files(bot, chat_id, course_id, files, start=0, checkpoint=None):
+        # The last segment of a resumed job: one file was sent before the restart
+        await checkpoint(len(files), len(files) - start, 0)
+        return True
+
+    async def checkpoint_job(*args):
+        pass
+
+    async def finish_job(job_id, status=delivery.DONE, error=None):
+        # Only the first call finds the job still running
+        finished.append(status)
+        return len(finished) == 1
+
+    async def record_course_download(course_id):
+        downloads.append(course_id)
+
+    for name, fake in (("get_course_snapshot", get_course_snapshot), ("send_all_files", send_all_files),
+                       ("checkpoint_job", checkpoint_job), ("finish_job", finish_job),
+                       ("record_course_download", record_course_download)):
+        monkeypatch.setattr(delivery, name, fake)
+
+    queue = DeliveryQueue()
+    queue._bot = UnreachableBot()
+    job = {"_id": 1, "user_id": 7, "course_id": "c", "chat_id": 7, "cursor": 1, "sent": 1, "failed": 0}
+    asyncio.run(queue._run(job))
+    asyncio.run(queue._run(dict(job, cursor=2, sent=2)))
+
+    assert finished == [delivery.DONE, delivery.DONE]
+    assert downloads == ["c"]
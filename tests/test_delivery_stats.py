@@ -0,0 +1,24 @@
+import asyncio
+import database.delivery_db as delivery_db
+
+class FakeJobs:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.queries = 0
+
+    async def count_documents(self, query):
+        self.queries += 1
+        return self.statuses.count(query["status"])
+
+def test_queue_stats_are_cached(monkeypatch):
+    jobs = FakeJobs(["pending", "pending", "done"])
+    monkeypatch.setattr(delivery_db, "jobs_col", jobs)
+    delivery_db._stats_cache.clear()
+
+    first = asyncio.run(delivery_db.get_queue_stats())
+    queries = jobs.queries
+    jobs.statuses.append("failed")
+    second = asyncio.run(delivery_db.get_queue_stats())
+
+    assert first == second == {"pending": 2, "running": 0, "done": 1, "failed": 0}
+    assert jobs.queries == queries
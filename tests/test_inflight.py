@@ -0,0 +1,30 @@
+from inflight import InflightRegistry, RUNNING, COOLDOWN, BUSY
+
+def test_queued_delivery_coalesces_repeat_requests():
+    registry = InflightRegistry(user_limit=1, cooldown=30)
+    delivery = registry.queue(1, "a")
+    assert registry.queue(1, "a") is delivery
+    assert registry.check(1, "a") == (RUNNING, delivery)
+    assert registry.coalesced == 0
+    registry.coalesce(RUNNING, delivery)
+    assert registry.coalesced == 1
+
+def test_limit_counts_only_sending_deliveries():
+    registry = InflightRegistry(user_limit=1, cooldown=30)
+    first = registry.queue(1, "a")
+    second = registry.queue(1, "b")
+    assert registry.check(1, "c") == (None, None)
+    assert registry.begin(first, 10)
+    assert registry.check(1, "c") == (BUSY, None)
+    assert not registry.begin(second, 10)
+    first.sent = 10
+    registry.finish(first)
+    assert registry.begin(second, 10)
+    assert registry.check(1, "a") == (COOLDOWN, first)
+
+def test_busy_is_not_counted_as_coalesced():
+    registry = InflightRegistry(user_limit=1, cooldown=0)
+    registry.start(1, "a")
+    reason, active = registry.check(1, "b")
+    registry.coalesce(reason, active)
+    assert reason == BUSY and registry.coalesced == 0
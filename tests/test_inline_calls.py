@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from database import courses_db
+from plugins import inline
+from utils import temp
+
+class CountingClient:
+    """Fake client that records every Bot API method called on it."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            self.calls.append(name)
+        return call
+
+class FakeInlineQuery:
+    def __init__(self, text, offset=""):
+        self.query = text
+        self.offset = offset
+        self.answers = []
+
+    async def answer(self, results, **kwargs):
+        self.answers.append(results)
+
+@pytest.fixture
+def catalog(monkeypatch):
+    courses_db.course_index.clear()
+    for i in range(25):
+        courses_db.course_index.add({
+            "course_id": f"c{i}", "course_name": f"Gambit Course {i}", "file_count": 3, "total_size": 1024
+        })
+    courses_db.course_index.ready = True
+    courses_db._search_cache.clear()
+    temp.INLINE_RESULTS.clear()
+    monkeypatch.setattr(temp, "U_NAME", "TestBot")
+    yield
+    courses_db.course_index.clear()
+    courses_db._search_cache.clear()
+    temp.INLINE_RESULTS.clear()
+
+def test_inline_query_makes_no_api_calls_per_result(catalog):
+    client = CountingClient()
+    query = FakeInlineQuery("gambit")
+    asyncio.run(inline.inline_search(client, query))
+
+    assert len(query.answers) == 1
+    results = query.answers[0]
+    assert len(results) == 20
+    assert client.calls == []
+    assert all("t.me/TestBot?start=course_" in r.reply_markup.inline_keyboard[0][0].url for r in results)
@@ -0,0 +1,32 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+import premium_expiry
+from premium_expiry import ExpiryScheduler
+
+class FlakyDb:
+    def __init__(self):
+        self.fail = True
+        self.expired = []
+
+    async def expire_premium_users(self, user_ids, now=None):
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        self.expired.extend(user_ids)
+        return len(user_ids)
+
+def test_failed_expiry_is_kept_for_retry(monkeypatch):
+    fake = FlakyDb()
+    monkeypatch.setattr(premium_expiry, "db", fake)
+    scheduler = ExpiryScheduler()
+    scheduler._loaded_until = datetime.now() + timedelta(days=1)
+    scheduler.schedule(1, datetime.now() - timedelta(seconds=1))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(scheduler._expire_due())
+    assert scheduler._retry_at is not None
+
+    fake.fail = False
+    asyncio.run(scheduler._expire_due())
+    assert fake.expired == [1]
+    assert scheduler._expiries == {} and scheduler._retry_at is None
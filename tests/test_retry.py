@@ -0,0 +1,28 @@
+import asyncio
+import pytest
+from pyrogram.errors import InternalServerError
+from retry import RetryPolicy, RetryStats
+
+def test_stats_count_retries_and_give_ups():
+    policy = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+    stats = RetryStats()
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        raise InternalServerError()
+
+    with pytest.raises(InternalServerError):
+        asyncio.run(policy.call(flaky, stats=stats))
+    assert len(calls) == 3
+    assert (stats.retried, stats.failed) == (2, 1)
+
+def test_permanent_error_fails_without_retrying():
+    stats = RetryStats()
+
+    async def broken():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(RetryPolicy().call(broken, stats=stats))
+    assert (stats.retried, stats.failed) == (0, 1)
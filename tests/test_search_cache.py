@@ -0,0 +1,80 @@
+import pytest
+from database import courses_db
+from database.search_index import can_narrow
+
+COURSES = [
+    {"course_id": "a", "course_name": "Macaroni Gambit"},
+    {"course_id": "b", "course_name": "Caro Kann"},
+]
+
+@pytest.fixture(autouse=True)
+def index():
+    courses_db.course_index.clear()
+    for course in COURSES:
+        courses_db.course_index.add(course)
+    courses_db.course_index.ready = True
+    courses_db._search_cache.clear()
+    yield courses_db.course_index
+    courses_db.course_index.clear()
+    courses_db._search_cache.clear()
+
+@pytest.mark.parametrize("fuzzy", [False, True])
+def test_incremental_typing_matches_cold_rank(index, fuzzy):
+    for query in ["c", "ca", "car", "caro"]:
+        ranked = courses_db._ranked_courses(query, fuzzy)
+        assert ranked.course_ids == index.rank(query, fuzzy).course_ids
+    assert sorted(ranked.course_ids) == ["a", "b"]
+
+def test_empty_narrowed_result_is_kept(index):
+    courses_db._ranked_courses("caro", False)
+    hits = courses_db._search_prefix_hits
+    assert courses_db._ranked_courses("caroz", False).course_ids == []
+    assert courses_db._search_prefix_hits == hits + 1
+
+def test_fuzzy_search_is_not_cut_short_by_empty_narrowing(index):
+    courses_db._ranked_courses("caro", True)
+    assert courses_db._ranked_courses("caro gambt", True).course_ids == ["a"]
+
+def test_can_narrow():
+    assert can_narrow(["car"], ["caro"])
+    assert can_narrow(["caro"], ["caro", "k"])
+    assert not can_narrow(["ca"], ["car"])
+    assert not can_narrow(["kann"], ["caro"])
+    assert not can_narrow(["caro", "kann"], ["caro"])
+
+def test_keyset_pages_survive_new_courses():
+    from datetime import datetime, timedelta
+    from database.search_index import CourseSearchIndex
+    index = CourseSearchIndex()
+    start = datetime(2024, 1, 1)
+    for i in range(30):
+        index.add({"course_id": f"c{i}", "course_name": f"Endgame {i}", "added_on": start + timedelta(days=i), "download_count": i})
+
+    first, _, cursor = index.search("endgame", max_results=10)
+    # A newer and far more popular course used to move every other course's key
+    index.add({"course_id": "new", "course_name": "Endgame Masterclass", "added_on": datetime.now(), "download_count": 10**6})
+    second, _, _ = index.search("endgame", max_results=10, after=cursor)
+
+    seen = [course["course_id"] for course in first + second]
+    assert len(set(seen)) == 20
+    expected = [cid for cid in index.rank("endgame").course_ids[::-1] if cid != "new"][:20]
+    assert seen == expected
+
+@pytest.mark.parametrize("max_results,offset", [(3, 0), (5, 2), (50, 0)])
+def test_first_page_matches_full_order(max_results, offset):
+    from database.search_index import CourseSearchIndex
+    index = CourseSearchIndex()
+    # No dates or downloads, so most scores tie and _id decides the order
+    for i in range(20):
+        index.add({"course_id": f"c{i}", "course_name": "Endgame Basics" if i % 3 else "Endgame"})
+    full = index.rank("endgame")
+    expected = full.course_ids[::-1][offset:offset + max_results]
+
+    courses, total, cursor = index.page(index.rank("endgame"), max_results, offset)
+    assert [course["course_id"] for course in courses] == expected
+    assert total == 20
+    if offset + max_results < 20:
+        rest, _, _ = index.page(index.rank("endgame"), 20, after=cursor)
+        assert [course["course_id"] for course in rest] == full.course_ids[::-1][offset + max_results:]
+    else:
+        assert cursor is None
@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileType
+import utils
+
+class FakeBot:
+    """Media groups fail, single sends succeed until the flood_at-th call."""
+
+    def __init__(self, flood_at):
+        self.flood_at = flood_at
+        self.delivered = []
+
+    async def send_media_group(self, **kwargs):
+        raise ValueError("MEDIA_INVALID")
+
+    async def send_cached_media(self, chat_id, file_id, **kwargs):
+        if len(self.delivered) == self.flood_at:
+            raise FloodWait(value=3600)
+        self.delivered.append(file_id)
+
+@pytest.fixture(autouse=True)
+def documents(monkeypatch):
+    monkeypatch.setattr(utils, "get_file_type", lambda file_id: FileType.DOCUMENT)
+
+def test_flood_wait_mid_batch_checkpoints_the_next_unsent_file():
+    files = [{"file_id": f"f{i}", "file_name": f"{i}.pdf"} for i in range(4)]
+    bot = FakeBot(flood_at=2)
+    checkpoints = []
+
+    async def checkpoint(cursor, sent, failed):
+        checkpoints.append((cursor, sent, failed))
+
+    with pytest.raises(FloodWait):
+        asyncio.run(utils.send_all_files(bot, 1, "course", files, checkpoint=checkpoint))
+
+    assert bot.delivered == ["f0", "f1"]
+    assert checkpoints == [(2, 2, 0)]
+
+def test_send_file_batch_reports_position_reached():
+    files = [{"file_id": f"f{i}"} for i in range(3)]
+    with pytest.raises(utils.BatchInterrupted) as raised:
+        asyncio.run(utils.send_file_batch(FakeBot(flood_at=1), 1, files, [""] * 3))
+    assert (raised.value.done, raised.value.sent) == (1, 1)
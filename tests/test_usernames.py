@@ -0,0 +1,82 @@
+import asyncio
+import database.users_chats_db as users_chats_db
+from database.users_chats_db import Database
+
+class FakeUsers:
+    """In-memory stand-in for the users collection, counting writes."""
+
+    def __init__(self):
+        self.docs = {}
+        self.writes = 0
+
+    def _matches(self, doc, query):
+        for field, value in query.items():
+            if isinstance(value, dict):
+                if doc.get(field) == value["$ne"]:
+                    return False
+            elif doc.get(field) != value:
+                return False
+        return True
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        self.writes += 1
+        doc = self.docs.get(query["_id"])
+        previous = dict(doc) if doc else None
+        if doc is None:
+            if not upsert:
+                return None
+            doc = self.docs[query["_id"]] = {"_id": query["_id"]}
+        doc.update(update["$set"])
+        return previous
+
+    async def update_many(self, query, update):
+        self.writes += 1
+        for doc in self.docs.values():
+            if self._matches(doc, query):
+                doc.update(update["$set"])
+
+    async def find_one(self, query, projection=None):
+        return next((doc for doc in self.docs.values() if self._matches(doc, query)), None)
+
+def make_db(monkeypatch):
+    users = FakeUsers()
+    monkeypatch.setattr(users_chats_db, "users_collection", users)
+    return Database(), users
+
+def test_refresh_skips_unchanged_username(monkeypatch):
+    db, users = make_db(monkeypatch)
+
+    async def scenario():
+        await db.add_user(1, "Alice")
+        writes = users.writes
+        await db.refresh_user(1, "Alice")
+        await db.refresh_user(1, "Alice")
+        return writes
+
+    writes = asyncio.run(scenario())
+    assert users.writes == writes
+
+def test_username_moves_to_new_owner(monkeypatch):
+    db, users = make_db(monkeypatch)
+
+    async def scenario():
+        await db.add_user(1, "alice")
+        assert await db.get_user_id_by_username("@Alice") == 1
+        # User 1 renames, then user 2 takes the freed name
+        await db.refresh_user(1, "alice_old")
+        assert await db.get_user_id_by_username("alice") is None
+        await db.add_user(2, "Alice")
+        return await db.get_user_id_by_username("alice"), await db.get_user_id_by_username("alice_old")
+
+    assert asyncio.run(scenario()) == (2, 1)
+
+def test_claiming_a_name_clears_stale_holders(monkeypatch):
+    db, users = make_db(monkeypatch)
+    users.docs[1] = {"_id": 1, "username": "bob", "username_lower": "bob"}
+
+    async def scenario():
+        await db.add_user(2, "Bob")
+        return await db.get_user_id_by_username("bob")
+
+    assert asyncio.run(scenario()) == 2
+    assert users.docs[1]["username_lower"] is None
@@ -6,22 +6,44 @@ import asyncio
 import logging
 import requests
 import aiohttp
-from pyrogram.errors import UserNotParticipant
-from info import FORCE_SUB, PUBLIC_CHANNEL, AUTO_DELETE, AUTO_SEND_AFTER_SUBSCRIBE, TUTORIAL_BUTTON_ENABLED, TUTORIAL_BUTTON_URL, SHORTENER_API, SHORTENER_DOMAIN, SHORTENER_API_KEY, SHORTENER_ENABLED
+from pyrogram.errors import UserNotParticipant, FloodWait
+from pyrogram.file_id import FileId, FileType
+from pyrogram.types import InputMediaPhoto, InputMediaVideo, InputMediaAudio, InputMediaDocument
+from database.cache import LRUCache
+from database.membership import membership
+from retry import retry_policy
+from info import INLINE_CACHE_SIZE, PROTECT_CONTENT, MEDIA_GROUP_DELIVERY, FORCE_SUB, PUBLIC_CHANNEL, AUTO_DELETE, AUTO_SEND_AFTER_SUBSCRIBE, TUTORIAL_BUTTON_ENABLED, TUTORIAL_BUTTON_URL, SHORTENER_API, SHORTENER_DOMAIN, SHORTENER_API_KEY, SHORTENER_ENABLED
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 BTN = {}
 
+# Telegram allows up to 10 items per album; photos and videos may be mixed,
+# documents and audio only with their own kind.
+MEDIA_GROUP_SIZE = 10
+MEDIA_GROUP_KINDS = {
+    FileType.PHOTO: "visual",
+    FileType.VIDEO: "visual",
+    FileType.DOCUMENT: "document",
+    FileType.AUDIO: "audio"
+}
+INPUT_MEDIA_TYPES = {
+    FileType.PHOTO: InputMediaPhoto,
+    FileType.VIDEO: InputMediaVideo,
+    FileType.DOCUMENT: InputMediaDocument,
+    FileType.AUDIO: InputMediaAudio
+}
+
 class temp:
     """Temporary storage for various data used by the bot."""
     BOT = None
     ME = None
+    ME_USER = None
     U_NAME = None
     B_NAME = None
-    BANNED_USERS = []
-    BANNED_CHATS = []
+    BANNED_USERS = membership.banned_users
+    BANNED_CHATS = membership.banned_chats
     
     # For storing course data during the course creation process
     CURRENT_COURSES = {}
@@ -31,17 +53,38 @@ class temp:
     # For storing search results
     SEARCH_DATA = {}
     
+    # Prebuilt inline query results keyed by course_id
+    INLINE_RESULTS = LRUCache(max_size=INLINE_CACHE_SIZE)
+    
     # For storing temporary verification data
     VERIFICATION_DATA = {}
     
     # For storing user's pending downloads (for force subscribe)
     PENDING_DOWNLOADS = {}
     
-    # For storing premium user data
-    PREMIUM_USERS = []
-    
-    # For broadcast message
-    BROADCAST_MSG = ""
+    # Ids of premium users (kept current by the database write methods)
+    PREMIUM_USERS = membership.premium_users
+
+async def get_bot_me(client=None):
+    """Return the bot's own User object, calling get_me() only if startup hasn't cached it."""
+    if temp.ME_USER is None:
+        me = await (client or temp.BOT).get_me()
+        if not me:
+            return None
+        temp.ME_USER = me
+        temp.ME = me.id
+        temp.U_NAME = me.username
+        temp.B_NAME = me.first_name
+    return temp.ME_USER
+
+def get_bot_username():
+    """Return the bot's username from the startup cache."""
+    return temp.U_NAME
+
+def get_deep_link(param, group=False):
+    """Build a t.me deep link that starts the bot (or adds it to a group) with a parameter."""
+    action = "startgroup" if group else "start"
+    return f"https://t.me/{temp.U_NAME}?{action}={param}"
 
 def get_size(size_in_bytes):
     """Convert bytes to human-readable sizes."""
@@ -134,15 +177,100 @@ async def delete_message_after_delay(bot, message, delay=300):
     except Exception as e:
         logger.error(f"Error deleting message: {e}")
 
-async def send_all_files(bot, chat_id, course_id, files):
-    """Send all files related to a course to a user."""
-    from database.courses_db import get_course_by_id
+def get_file_type(file_id):
+    """Return the pyrogram FileType encoded in a file_id, or None if it can't be decoded."""
+    try:
+        return FileId.decode(file_id).file_type
+    except Exception:
+        return None
+
+def batch_course_files(files, max_size=MEDIA_GROUP_SIZE):
+    """Split files into consecutive runs that can be sent as one media group.
+    
+    Files of a type that can't be grouped end up in a batch of their own.
+    """
+    if not MEDIA_GROUP_DELIVERY:
+        max_size = 1
+        
+    batches = []
+    current = []
+    current_kind = None
+    for file in files:
+        kind = MEDIA_GROUP_KINDS.get(get_file_type(file['file_id']))
+        if kind is None or kind != current_kind or len(current) >= max_size:
+            if current:
+                batches.append(current)
+            current = []
+        current.append(file)
+        current_kind = kind
+    if current:
+        batches.append(current)
+    return batches
+
+class BatchInterrupted(Exception):
+    """A FloodWait too long to wait out stopped a batch after its first `done` files.
     
-    # Get course details for logging
-    course = await get_course_by_id(course_id)
-    course_name = course.get('course_name', 'Unknown') if course else 'Unknown'
+    `sent` of those were delivered (the rest failed for other reasons); `error`
+    is the FloodWait, whose value says how long Telegram wants us to wait.
+    """
+    
+    def __init__(self, done, sent, error):
+        super().__init__(str(error))
+        self.done = done
+        self.sent = sent
+        self.error = error
+
+async def send_file_batch(bot, chat_id, batch, captions, protect_content=False, reply_markup=None, stats=None):
+    """Send a batch from batch_course_files, as a media group when it has more than one file.
+    
+    Each send is retried per retry_policy, counting retries in stats. Returns the
+    number of files sent. A FloodWait too long to wait out raises BatchInterrupted
+    with the position reached, so the caller can resume from the next unsent file;
+    any other media group error falls back to sending the files one by one.
+    """
+    if len(batch) > 1:
+        media = [
+            INPUT_MEDIA_TYPES[get_file_type(file['file_id'])](file['file_id'], caption=caption)
+            for file, caption in zip(batch, captions)
+        ]
+        try:
+            await retry_policy.call(bot.send_media_group, chat_id=chat_id, media=media, protect_content=protect_content, stats=stats)
+            return len(batch)
+        except FloodWait as e:
+            raise BatchInterrupted(0, 0, e)
+        except Exception as e:
+            logger.warning(f"Media group send failed, falling back to single files: {e}")
+    
+    sent = 0
+    for done, (file, caption) in enumerate(zip(batch, captions)):
+        try:
+            await retry_policy.call(
+                bot.send_cached_media,
+                chat_id=chat_id,
+                file_id=file['file_id'],
+                caption=caption,
+                protect_content=protect_content,
+                reply_markup=reply_markup,
+                stats=stats
+            )
+            sent += 1
+        except FloodWait as e:
+            raise BatchInterrupted(done, sent, e)
+        except Exception as e:
+            logger.error(f"Error sending file: {e}")
+    return sent
+
+async def send_all_files(bot, chat_id, course_id, files, start=0, checkpoint=None, stats=None):
+    """Send all files related to a course to a user.
     
-    logger.info(f"Sending {len(files)} files for course '{course_name}' to user {chat_id}")
+    Delivery begins at files[start]; checkpoint(cursor, sent, failed) is awaited
+    after every batch so an interrupted delivery can be resumed. A FloodWait too
+    long to wait out is raised after checkpointing the first unsent file.
+    Recording the download is left to the caller, which knows when the whole
+    course has been delivered.
+    """
+
+    logger.info(f"Sending {len(files) - start} files for course {course_id} to user {chat_id}")
     
     # Add tutorial button if enabled
     from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
@@ -153,31 +281,45 @@ async def send_all_files(bot, chat_id, course_id, files):
             [InlineKeyboardButton("📚 Tutorial", url=TUTORIAL_BUTTON_URL)]
         ])
     
-    # Send files
+    # Send files, grouping compatible ones into albums
     sent_files = 0
-    for file in files:
+    failed_files = 0
+    sent_album = False
+    cursor = start
+    for batch in batch_course_files(files[start:]):
+        captions = [
+            file['caption'] if file.get('caption') else f"📚 {file.get('file_name', 'Course file')}"
+            for file in batch
+        ]
+        interrupted = None
+        done = len(batch)
         try:
-            if 'caption' in file and file['caption']:
-                caption = file['caption']
-            else:
-                caption = f"📚 {file['file_name'] if 'file_name' in file else 'Course file'}"
-                
-            await bot.send_cached_media(
-                chat_id=chat_id,
-                file_id=file['file_id'],
-                caption=caption,
-                protect_content=PROTECT_CONTENT,
-                reply_markup=tutorial_buttons
-            )
-            sent_files += 1
-            # Small delay to prevent flooding
-            await asyncio.sleep(0.5)
+            sent = await send_file_batch(bot, chat_id, batch, captions, PROTECT_CONTENT, tutorial_buttons, stats)
+            sent_album = sent_album or len(batch) > 1
+        except BatchInterrupted as e:
+            interrupted = e
+            done, sent = e.done, e.sent
         except Exception as e:
-            logger.error(f"Error sending file: {e}")
-            continue
+            logger.error(f"Error sending files: {e}")
+            sent = 0
+        sent_files += sent
+        failed_files += done - sent
+        cursor += done
+        if checkpoint:
+            await checkpoint(cursor, sent_files, failed_files)
+        if interrupted:
+            logger.warning(f"Delivery of course {course_id} to {chat_id} stopped at file {cursor}: {interrupted}")
+            raise interrupted.error
     
-    logger.info(f"Successfully sent {sent_files} files for course '{course_name}' to user {chat_id}")
-    return sent_files == len(files)
+    # Albums can't carry buttons, so offer the tutorial once at the end
+    if sent_album and tutorial_buttons:
+        try:
+            await bot.send_message(chat_id=chat_id, text="📚 Need help with this course?", reply_markup=tutorial_buttons)
+        except Exception as e:
+            logger.error(f"Error sending tutorial button: {e}")
+    
+    logger.info(f"Successfully sent {sent_files} files for course {course_id} to user {chat_id}")
+    return sent_files == len(files) - start
 
 async def check_premium_user(user_id):
     """Check if a user has premium access."""
@@ -186,23 +328,19 @@ async def check_premium_user(user_id):
         return False
         
     # Admins always have premium access
-    from info import ADMINS
-    if user_id in ADMINS:
+    if user_id in membership.admins:
         return True
         
-    # Check if user ID is in the premium users list
-    if user_id in temp.PREMIUM_USERS:
-        return True
+    # Answer from the premium set or the recent non-premium cache
+    cached = membership.is_premium(user_id)
+    if cached is not None:
+        return cached
         
     # Check database for premium status
     user = await db.get_user(user_id)
-    if user and user.get('is_premium', False):
-        # Cache the result
-        if user_id not in temp.PREMIUM_USERS:
-            temp.PREMIUM_USERS.append(user_id)
-        return True
-        
-    return False
+    is_premium = bool(user and user.get('is_premium', False))
+    membership.set_premium(user_id, is_premium)
+    return is_premium
 
 async def store_pending_download(user_id, course_id):
     """Store a pending download for a user who needs to subscribe."""
@@ -222,35 +360,32 @@ async def process_pending_downloads(bot, user_id):
     if user_id not in temp.PENDING_DOWNLOADS:
         return False
         
-    from database.courses_db import get_course_by_id, get_course_files
+    from database.courses_db import get_course_snapshot
+    from delivery import delivery_queue
     
-    success = True
     for course_id in temp.PENDING_DOWNLOADS[user_id]:
-        course = await get_course_by_id(course_id)
-        if not course:
-            continue
-            
-        files = await get_course_files(course_id)
-        if not files:
+        snapshot = await get_course_snapshot(course_id)
+        if not snapshot:
             continue
+        course = snapshot.course
             
         # Send welcome message
         welcome_text = f"<b>Welcome to the {course['course_name']} course!</b>\n\nNow that you've subscribed, I'll send you all files related to this course."
         await bot.send_message(chat_id=user_id, text=welcome_text)
         
-        # Send all files
-        result = await send_all_files(bot, user_id, course_id, files)
-        if not result:
-            success = False
-            
-        # Send completion message
-        complete_text = "<b>✅ All course files have been sent!\n\nEnjoy learning chess. If you need more courses, just search or browse our collection.</b>"
-        await bot.send_message(chat_id=user_id, text=complete_text)
+        # Files and the completion message go out from the delivery queue
+        await delivery_queue.enqueue(user_id, user_id, course_id)
     
     # Clear pending downloads
     temp.PENDING_DOWNLOADS[user_id] = []
     
-    return success
+    return True
+
+def get_progress_bar(done, total, width=10):
+    """Return a text progress bar like '▰▰▰▱▱▱▱▱▱▱ 30%'."""
+    fraction = done / total if total else 1
+    filled = int(fraction * width)
+    return f"{'▰' * filled}{'▱' * (width - filled)} {fraction:.0%}"
 
 def get_readable_time(seconds):
     """Get human-readable time from seconds."""